@@ -0,0 +1,155 @@
+"""Measure the read endpoints of the api as `files_data` grows.
+
+For each corpus size the database is seeded with `benchmarks.corpus`,
+then each endpoint is called by concurrent clients, with the years and
+codes of the queries picked at random. The throughput and latency of
+each endpoint at each level of concurrency are printed, and saved as
+JSON with `--output` so that the results of two commits can be
+compared.
+
+The app is called in process unless `--url` is given, in which case
+the server there must use the same database. Run from the backend
+folder against a local mongod:
+
+    DB_TOKEN=mongodb://localhost:27017 DB_TLS=false DB_NAME=NAAC_benchmark \\
+        python -m benchmarks.api --sizes 10000 100000 1000000 --output api.json
+
+or, for a quick run of small sizes, against an in-memory database with
+`--memory`.
+"""
+import argparse
+import asyncio
+import os
+import platform
+import random
+import subprocess
+from datetime import datetime
+from json import dumps
+from typing import Callable, Union
+
+from benchmarks.async_database import run_load
+from benchmarks.corpus import seed_corpus, use_memory_database
+from drivereader.codes import code_index
+
+# How each endpoint is called, by the name it is reported under.
+ENDPOINTS: dict[str, Callable[[random.Random, int, int, list[str]], str]] = {
+    "/api/naac": lambda rng, start, end, codes:
+        f"/api/naac?year={start}-{rng.randint(start, end)}",
+    "/api/files": lambda rng, start, end, codes:
+        f"/api/files?year={rng.randint(start, end)}&code={rng.choice(codes)}",
+    "/api/files?limit": lambda rng, start, end, codes:
+        f"/api/files?year={rng.randint(start, end)}&limit=100",
+    "/api/sort": lambda rng, start, end, codes: "/api/sort",
+    "/api/folders": lambda rng, start, end, codes: "/api/folders",
+}
+
+
+def current_commit() -> Union[str, None]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def benchmark_endpoints(http, endpoints: list[str], requests: int,
+        concurrency_levels: list[int], start_year: int, end_year: int
+        ) -> dict:
+    rng = random.Random(0)
+    codes = list(code_index().codes)
+    results = {}
+    for name in endpoints:
+        make_path = ENDPOINTS[name]
+        errors = 0
+
+        async def call():
+            nonlocal errors
+            response = await http.get(make_path(rng, start_year, end_year, codes))
+            if response.status_code != 200:
+                errors += 1
+
+        results[name] = {}
+        for concurrency in concurrency_levels:
+            errors = 0
+            result = await run_load(call, requests, concurrency)
+            results[name][concurrency] = {**result, "errors": errors}
+            print(f"  {name} x{concurrency}: {result['throughput']}/s "
+                  f"p50 {result['p50']}ms p95 {result['p95']}ms "
+                  f"p99 {result['p99']}ms errors {errors}")
+    return results
+
+async def benchmark(args) -> dict:
+    import httpx
+    if args.url:
+        http = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        from main import app
+        http = httpx.AsyncClient(app=app, base_url="http://benchmark", timeout=60)
+
+    results = {}
+    async with http:
+        for size in args.sizes:
+            corpus = seed_corpus(size, args.start_year, args.end_year,
+                                 args.folders, reseed=args.reseed)
+            if not args.memory:
+                from drivereader.indexes import ensure_indexes
+                ensure_indexes()
+            print(f"{size} files, seeded in {corpus['seed_time']}s")
+            results[size] = {
+                "corpus": corpus,
+                "endpoints": await benchmark_endpoints(
+                    http, args.endpoints, args.requests, args.concurrency,
+                    args.start_year, args.end_year)
+            }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+        help="The numbers of classified files to seed, one run each.")
+    parser.add_argument("--start-year", type=int, default=2000,
+        help="The first year of the files.")
+    parser.add_argument("--end-year", type=int, default=2023,
+        help="The last year of the files.")
+    parser.add_argument("--folders", type=int, default=50,
+        help="The number of folders the files are in.")
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS),
+        choices=list(ENDPOINTS), help="The endpoints to call.")
+    parser.add_argument("--requests", type=int, default=1000,
+        help="The calls made to each endpoint at each level of concurrency.")
+    parser.add_argument("--concurrency", type=int, nargs="+",
+        default=[1, 10, 50],
+        help="The numbers of clients calling at once.")
+    parser.add_argument("--no-cache", action="store_true",
+        help="Turn off the result cache of the app called in process.")
+    parser.add_argument("--memory", action="store_true",
+        help="Use an in-memory database instead of the one in DB_TOKEN.")
+    parser.add_argument("--reseed", action="store_true",
+        help="Seed the corpus even if the database already holds it.")
+    parser.add_argument("--url", help="Call the api at this url instead of "
+        "in process.")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        # Read when the cache is made, on the first import of the app.
+        os.environ["RESULT_CACHE_SIZE"] = "0"
+    if args.memory:
+        if args.url:
+            parser.error("--memory can only be used with the app in process.")
+        use_memory_database()
+
+    results = {
+        "commit": current_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key != "output"},
+        "sizes": asyncio.run(benchmark(args))
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Compare the blocking and the motor data layers under concurrent load.
+
+The blocking functions are run the way FastAPI runs a `def` endpoint,
+in a threadpool of `THREADS` workers, and the motor ones the way it
+runs an `async def` endpoint, straight on the event loop.
+
+Run from the backend folder against the database in `DB_TOKEN`:
+
+    python -m benchmarks.async_database --requests 2000
+"""
+import argparse
+import asyncio
+from functools import partial
+from json import dumps
+from statistics import quantiles
+from time import perf_counter
+
+import anyio
+
+from drivereader import async_database, database
+
+# The default size of the threadpool of FastAPI.
+THREADS = 40
+
+
+async def run_load(call, requests: int, concurrency: int) -> dict:
+    """Make `requests` calls, `concurrency` at a time.
+
+    Returns
+    -------
+    - dict: The calls made per second, and the latency percentiles in
+        milliseconds.
+    """
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed_call():
+        async with semaphore:
+            start = perf_counter()
+            await call()
+            latencies.append((perf_counter() - start) * 1000)
+
+    start = perf_counter()
+    await asyncio.gather(*(timed_call() for _ in range(requests)))
+    elapsed = perf_counter() - start
+    cuts = quantiles(latencies, n=100)
+    return {
+        "throughput": round(requests / elapsed, 1),
+        "p50": round(cuts[49], 2),
+        "p95": round(cuts[94], 2),
+        "p99": round(cuts[98], 2)
+    }
+
+async def benchmark(requests: int, concurrency_levels: list[int]) -> dict:
+    limiter = anyio.CapacityLimiter(THREADS)
+    start_year, end_year = database.get_valid_years()
+    if start_year is None:
+        raise SystemExit("The database has no files to read.")
+
+    calls = {
+        "fetch_naac_count": (
+            partial(database.fetch_naac_count, start_year, end_year),
+            partial(async_database.fetch_naac_count, start_year, end_year)
+        ),
+        "fetch_all_files": (
+            partial(database.fetch_all_files, None, end_year, end_year),
+            partial(async_database.fetch_all_files, None, end_year, end_year)
+        ),
+    }
+    results = {}
+    for name, (blocking, asynchronous) in calls.items():
+        results[name] = {}
+        for concurrency in concurrency_levels:
+            threaded = await run_load(
+                partial(anyio.to_thread.run_sync, blocking, limiter=limiter),
+                requests, concurrency
+            )
+            awaited = await run_load(asynchronous, requests, concurrency)
+            results[name][concurrency] = {
+                "threadpool": threaded,
+                "motor": awaited,
+                "speedup": round(awaited["throughput"] / threaded["throughput"], 2)
+            }
+            print(f"{name} x{concurrency}: threadpool "
+                  f"{threaded['throughput']}/s p95 {threaded['p95']}ms, motor "
+                  f"{awaited['throughput']}/s p95 {awaited['p95']}ms")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000,
+        help="The calls made at each level of concurrency.")
+    parser.add_argument("--concurrency", type=int, nargs="+",
+        default=[1, 10, 50, 200],
+        help="The numbers of calls in flight at once.")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args.requests, args.concurrency))
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
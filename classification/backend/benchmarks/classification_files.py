@@ -0,0 +1,103 @@
+"""Compare reading the files of a classification with one `$in` query
+against one `/api/files` call per code.
+
+The calls per code are made both one after the other, as a client
+walking the codes would, and all at once.
+
+Run from the backend folder against the database in `DB_TOKEN`:
+
+    python -m benchmarks.classification_files --requests 500
+"""
+import argparse
+import asyncio
+from json import dumps
+
+from benchmarks.async_database import run_load
+from drivereader import async_database
+from drivereader.codes import code_index
+
+
+async def per_code_sequential(codes: tuple[str, ...], start_year: int,
+        end_year: int):
+    files = {}
+    for code in codes:
+        code_files, _ = await async_database.fetch_all_files(
+            code, start_year, end_year)
+        for year, year_files in code_files.items():
+            files.setdefault(year, []).extend(year_files)
+    return files
+
+async def per_code_gathered(codes: tuple[str, ...], start_year: int,
+        end_year: int):
+    files = {}
+    results = await asyncio.gather(*(
+        async_database.fetch_all_files(code, start_year, end_year)
+        for code in codes
+    ))
+    for code_files, _ in results:
+        for year, year_files in code_files.items():
+            files.setdefault(year, []).extend(year_files)
+    return files
+
+async def single_query(codes: tuple[str, ...], start_year: int, end_year: int):
+    files, _ = await async_database.fetch_all_files(
+        list(codes), start_year, end_year)
+    return files
+
+async def benchmark(classifications: list[str], requests: int,
+        concurrency: int) -> dict:
+    start_year, end_year = await async_database.get_valid_years()
+    if start_year is None:
+        raise SystemExit("The database has no files to read.")
+
+    index = code_index()
+    if not classifications:
+        # The classifications with the most codes gain the most.
+        classifications = sorted(
+            index.codes_by_classification,
+            key=lambda classification: -len(index.codes_by_classification[classification])
+        )[:3]
+
+    results = {}
+    for classification in classifications:
+        codes = index.codes_by_classification.get(classification)
+        if codes is None:
+            raise SystemExit(f"No codes count towards {classification}.")
+        results[classification] = {"codes": list(codes)}
+        for name, read in (("per_code_sequential", per_code_sequential),
+                           ("per_code_gathered", per_code_gathered),
+                           ("single_query", single_query)):
+            results[classification][name] = await run_load(
+                lambda: read(codes, start_year, end_year),
+                requests, concurrency
+            )
+        single = results[classification]["single_query"]
+        sequential = results[classification]["per_code_sequential"]
+        results[classification]["speedup"] = round(
+            single["throughput"] / sequential["throughput"], 2)
+        print(f"{classification} ({len(codes)} codes): single query "
+              f"{single['throughput']}/s p95 {single['p95']}ms, per code "
+              f"{sequential['throughput']}/s p95 {sequential['p95']}ms")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("classifications", nargs="*",
+        help="The classifications to read, the three with the most codes "
+             "if none are given.")
+    parser.add_argument("--requests", type=int, default=500,
+        help="The reads made of each classification in each way.")
+    parser.add_argument("--concurrency", type=int, default=10,
+        help="The number of reads in flight at once.")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = asyncio.run(
+        benchmark(args.classifications, args.requests, args.concurrency))
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
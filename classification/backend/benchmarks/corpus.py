@@ -0,0 +1,142 @@
+"""A synthetic corpus of files for the benchmarks.
+
+The codes of the files follow `code_list.json`: a code is picked as
+often as the number of classifications it counts towards, so the
+classifications fill up the way they do with real files.
+
+Seeding drops the collections of the files first, so like every
+benchmark that writes it is refused on the `NAAC` database unless it is
+in memory; set `DB_NAME` to one the benchmarks may overwrite.
+"""
+import random
+from time import perf_counter
+
+from drivereader import async_database, database
+from drivereader.codes import code_index
+from drivereader.drive import file_details_from_name
+
+# The files written to the database at a time.
+SEED_BATCH_SIZE = 10000
+# Changed whenever the files seeded change, so that an older corpus is
+# seeded again.
+CORPUS_VERSION = 2
+WORDS = ("annual", "report", "seminar", "workshop", "minutes", "syllabus",
+         "revision", "faculty", "research", "paper", "award", "student",
+         "placement", "alumni", "feedback", "survey", "circular", "notice",
+         "extension", "activity", "meeting", "certificate", "proceedings")
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+in_memory = False
+
+
+def use_memory_database():
+    """Point the data layers at an in-memory database, for a quick run
+    without a mongod. Needs `mongomock` and `mongomock-motor`."""
+    try:
+        import mongomock
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("The in-memory database needs mongomock and "
+                         "mongomock-motor installed.")
+    global in_memory
+    in_memory = True
+    client = mongomock.MongoClient()
+    async_client = AsyncMongoMockClient(mock_mongo_client=client)
+    for module, memory in ((database, client[database.DB_NAME]),
+                           (async_database, async_client[database.DB_NAME])):
+        for name in dir(module):
+            if name.endswith("_data") or name in ("code_collection",
+                                                  "naac_counts"):
+                setattr(module, name, memory[getattr(module, name).name])
+
+def require_benchmark_database():
+    """Stop if the benchmarks would overwrite the `NAAC` database."""
+    if database.DB_NAME == "NAAC" and not in_memory:
+        raise SystemExit("Set DB_NAME to a database the benchmark may overwrite.")
+
+def file_name(rng: random.Random, year: int, code: str) -> str:
+    words = " ".join(rng.sample(WORDS, 3))
+    return f"{year}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}_{code}_{words}.pdf"
+
+def seed_corpus(size: int, start_year: int = 2000, end_year: int = 2023,
+        folder_count: int = 50, exempt_share: float = 0.05, seed: int = 0,
+        reseed: bool = False) -> dict:
+    """Fill the database with `size` classified files, unless it already
+    holds the same corpus.
+
+    Parameters
+    ----------
+    - size `int`: The number of classified files.
+    - start_year `int`: The first year in the names of the files.
+    - end_year `int`: The last year in the names of the files. The year
+        stored is the one the name gives, which is the next one for the
+        months from May.
+    - folder_count `int`: The number of folders the files are in.
+    - exempt_share `float`: The exempted files, as a share of `size`.
+    - seed `int`: The seed of the random corpus.
+    - reseed `bool`: Whether to seed even if the corpus is there.
+
+    Returns
+    -------
+    - dict: The corpus, and the seconds taken to seed it, None if it
+        was already there.
+    """
+    config = {"size": size, "start_year": start_year, "end_year": end_year,
+              "folder_count": folder_count, "exempt_share": exempt_share,
+              "seed": seed, "version": CORPUS_VERSION}
+    state = database.fetch_meta_document("benchmark_corpus") or {}
+    state.pop("_id", None)
+    if not reseed and state == config:
+        return {**config, "seed_time": None}
+    require_benchmark_database()
+
+    start = perf_counter()
+    rng = random.Random(seed)
+    for collection in (database.files_data, database.exempt_data,
+                       database.folders_data, database.naac_counts,
+                       database.code_collection):
+        collection.drop()
+    index = code_index()
+    database.code_insert_many(index.code_list)
+    codes = list(index.code_list)
+    weights = [len(index.classifications[code]) or 1 for code in codes]
+
+    folders = [{
+        "_id": f"folder{number}",
+        "name": f"Folder {number}",
+        "mimeType": FOLDER_MIME_TYPE,
+        "webViewLink": f"https://drive.google.com/drive/folders/folder{number}"
+    } for number in range(folder_count)]
+    database.folders_data.insert_many(folders)
+
+    written = 0
+    while written < size:
+        count = min(SEED_BATCH_SIZE, size - written)
+        files = []
+        for code in rng.choices(codes, weights, k=count):
+            name = file_name(rng, rng.randint(start_year, end_year), code)
+            # The year of the name as a scan reads it.
+            year, _ = file_details_from_name(name, index.codes)
+            files.append({
+                "_id": f"file{written + len(files)}",
+                "name": name,
+                "mimeType": "application/pdf",
+                "year": year,
+                "code": code,
+                "parent": f"folder{rng.randrange(folder_count)}"
+            })
+        database.files_data.insert_many(files, ordered=False)
+        written += count
+
+    exempt = [{
+        "_id": f"exempt{number}",
+        "name": f"Scan {number} {' '.join(rng.sample(WORDS, 2))}.pdf",
+        "mimeType": "application/pdf",
+        "parent": f"folder{rng.randrange(folder_count)}"
+    } for number in range(int(size * exempt_share))]
+    if len(exempt) != 0:
+        database.exempt_data.insert_many(exempt, ordered=False)
+
+    database.rebuild_naac_counts()
+    database.update_meta_document("benchmark_corpus", config)
+    return {**config, "seed_time": round(perf_counter() - start, 2)}
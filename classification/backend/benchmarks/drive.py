@@ -0,0 +1,186 @@
+"""Measure scans and uploads through `drivereader.drive` against the fake
+drive of `benchmarks.fake_drive`.
+
+The fake drive is filled with `--folders` folders of
+`--files-per-folder` files, and `scan_drive` is run once for each level
+of `--concurrency`, from an empty database each time, and with
+`--rescan` once more over the files it stored. Then `--uploads` files
+of `--upload-size` MB are uploaded with `stream_file_to_drive`, that
+many at a time at each level of concurrency. The files scanned and
+MB uploaded per second, and the requests the fake drive answered, are
+printed and saved as JSON with `--output`.
+
+The scans write to the database, so run from the backend folder
+against a local mongod, with `DB_NAME` set to a database the benchmark
+may overwrite:
+
+    DB_TOKEN=mongodb://localhost:27017 DB_TLS=false DB_NAME=NAAC_benchmark \\
+        python -m benchmarks.drive --folders 20 --files-per-folder 2000 \\
+        --latency 50 --throttle-rate 0.01 --concurrency 1 4 16
+
+`--memory` uses an in-memory database instead, which only suits small
+runs to try the harness: its writes and lookups scan whole collections,
+so the scan times it gives are mostly its own, over 10s for a thousand
+files even without latency.
+"""
+import argparse
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from json import dump, dumps
+from time import perf_counter
+
+from starlette.datastructures import Headers, UploadFile
+
+from benchmarks.corpus import require_benchmark_database, use_memory_database
+from benchmarks.fake_drive import FakeDrive, populate
+from drivereader import database, drive
+from drivereader.client import drive_client
+from drivereader.codes import code_index
+
+
+def reset_database():
+    for collection in (database.files_data, database.exempt_data,
+                       database.folders_data, database.naac_counts,
+                       database.uploads_data):
+        collection.drop()
+    database.meta_data.delete_many({"_id": {"$in": ["folders_config",
+                                                    "drive_changes"]}})
+
+def benchmark_scans(fake: FakeDrive, concurrency_levels: list[int],
+        rescan: bool = False) -> dict:
+    results = {}
+    for concurrency in concurrency_levels:
+        reset_database()
+        fake.requests.clear()
+        drive.SCAN_CONCURRENCY = concurrency
+        start = perf_counter()
+        summary = drive.scan_drive(parallel=concurrency > 1)
+        elapsed = perf_counter() - start
+        errors = [stats["error"] for stats in summary["folders"].values()
+                  if stats["error"] is not None]
+        results[concurrency] = {
+            "total_count": summary["total_count"],
+            "file_count": summary["file_count"],
+            "exempt_count": summary["exempt_count"],
+            "scan_time": round(elapsed, 4),
+            "files_per_second": round(summary["total_count"] / elapsed, 1),
+            "write_time": summary.get("write_time"),
+            "write_count": summary.get("write_count"),
+            "folder_errors": len(errors),
+            "requests": dict(fake.requests)
+        }
+        print(f"scan x{concurrency}: {summary['total_count']} files in "
+              f"{elapsed:.2f}s, {results[concurrency]['files_per_second']} "
+              f"files/s, {len(errors)} folders failed")
+        if rescan:
+            # Nothing has changed, so nothing should be written.
+            start = perf_counter()
+            summary = drive.scan_drive(parallel=concurrency > 1)
+            elapsed = perf_counter() - start
+            results[concurrency]["rescan"] = {
+                "scan_time": round(elapsed, 4),
+                "unchanged_count": summary["unchanged_count"],
+                "updated_count": summary["updated_count"],
+                "inserted_count": summary["inserted_count"],
+                "snapshot_time": summary["snapshot_time"],
+                "write_count": summary["write_count"]
+            }
+            print(f"rescan x{concurrency}: {summary['unchanged_count']} "
+                  f"unchanged, {summary['write_count']} writes in {elapsed:.2f}s")
+    return results
+
+def benchmark_uploads(fake: FakeDrive, count: int, size: int,
+        concurrency_levels: list[int]) -> dict:
+    codes = sorted(code_index().codes)
+    content = os.urandom(size)
+
+    def upload(number: int):
+        file = UploadFile(
+            BytesIO(content),
+            filename=f"20230101_{codes[number % len(codes)]}_Upload {number}.pdf",
+            headers=Headers({"content-type": "application/pdf"})
+        )
+        return drive.stream_file_to_drive(file)
+
+    results = {}
+    for concurrency in concurrency_levels:
+        fake.requests.clear()
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            responses = list(executor.map(upload, range(count)))
+        elapsed = perf_counter() - start
+        failed = sum(1 for response in responses if "error" in response)
+        megabytes = size * (count - failed) / 1024 / 1024
+        results[concurrency] = {
+            "uploads": count,
+            "failed": failed,
+            "upload_time": round(elapsed, 4),
+            "mb_per_second": round(megabytes / elapsed, 2),
+            "requests": dict(fake.requests)
+        }
+        print(f"upload x{concurrency}: {count - failed}/{count} files in "
+              f"{elapsed:.2f}s, {results[concurrency]['mb_per_second']} MB/s")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folders", type=int, default=10,
+        help="The number of folders to scan.")
+    parser.add_argument("--files-per-folder", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+        help="The folders listed, and files uploaded, at the same time.")
+    parser.add_argument("--uploads", type=int, default=8,
+        help="The number of files uploaded at each level of concurrency.")
+    parser.add_argument("--upload-size", type=float, default=4,
+        help="The size of each uploaded file in MB.")
+    parser.add_argument("--chunk-size", type=int,
+        default=drive.UPLOAD_CHUNK_SIZE // 1024,
+        help="The KB sent to drive at a time, a multiple of 256.")
+    parser.add_argument("--latency", type=float, default=0,
+        help="The milliseconds the fake drive delays each request by.")
+    parser.add_argument("--error-rate", type=float, default=0,
+        help="The share of requests that fail with a 500.")
+    parser.add_argument("--throttle-rate", type=float, default=0,
+        help="The share of requests that fail with a 429.")
+    parser.add_argument("--rescan", action="store_true",
+        help="Scan again after each scan, when no file has changed.")
+    parser.add_argument("--memory", action="store_true",
+        help="Use an in-memory database instead of the one in DB_TOKEN.")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    args = parser.parse_args()
+
+    if args.memory:
+        use_memory_database()
+    require_benchmark_database()
+
+    fake = FakeDrive(args.latency / 1000, args.error_rate, args.throttle_rate)
+    folder_names = populate(fake, args.folders, args.files_per_folder,
+                            sorted(code_index().codes))
+    server = fake.serve()
+    drive_client.root_url = server.root_url
+    drive.UPLOAD_CHUNK_SIZE = args.chunk_size * 1024
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as file:
+        dump(folder_names, file)
+    drive.FOLDERS_FILE = file.name
+
+    try:
+        results = {
+            "settings": {key: value for key, value in vars(args).items()
+                         if key != "output"},
+            "scan": benchmark_scans(fake, args.concurrency, args.rescan),
+            "upload": benchmark_uploads(fake, args.uploads,
+                                        int(args.upload_size * 1024 * 1024),
+                                        args.concurrency)
+        }
+    finally:
+        server.shutdown()
+        os.remove(file.name)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+"""A local stand-in for the parts of the drive v3 api the backend uses.
+
+It answers `files.list` with paging and the queries of
+`drivereader.drive`, `files.get`, `files.export`, `files.create` with
+resumable uploads, `changes.getStartPageToken`, `changes.list` and batch
+requests. Files can be renamed, moved, trashed and deleted, each adding
+its change to the feed of `changes.list`, and the page tokens given out
+can be expired. Every request can be delayed, and fail with a 500 or a
+429 at a given rate, to see how the backend copes with a slow or
+throttled drive.
+
+Point the backend at it with `DRIVE_ROOT_URL`, or run it on its own:
+
+    python -m benchmarks.fake_drive --folders 20 --files-per-folder 5000
+"""
+import argparse
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from typing import Union
+from urllib.parse import parse_qs, urlsplit
+from uuid import uuid4
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+Response = tuple[int, dict[str, str], bytes]
+
+
+def json_response(status: int, body: dict, headers: Union[dict, None] = None
+        ) -> Response:
+    return status, {"Content-Type": "application/json", **(headers or {})}, \
+        dumps(body).encode()
+
+def error_response(status: int, reason: str, message: str,
+        headers: Union[dict, None] = None) -> Response:
+    return json_response(status, {"error": {
+        "code": status,
+        "message": message,
+        "errors": [{"domain": "global", "reason": reason, "message": message}]
+    }}, headers)
+
+
+class FakeDrive():
+    """The files, changes and uploads of the fake drive.
+
+    Parameters
+    ----------
+    - latency `float`: The seconds each request is delayed by.
+    - error_rate `float`: The share of requests that fail with a 500.
+    - throttle_rate `float`: The share of requests that fail with a 429.
+    - seed `int`: The seed of the failures.
+    """
+
+    def __init__(self, latency: float = 0, error_rate: float = 0,
+            throttle_rate: float = 0, seed: int = 0) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.files: dict[str, dict] = {}
+        # The ids of the files in each folder.
+        self.children: dict[str, list[str]] = {}
+        self.contents: dict[str, bytes] = {}
+        self.changes: list[dict] = []
+        # The page tokens before the first are rejected with the status.
+        self.first_page_token = 0
+        self.expired_status = 410
+        # The name, size and bytes received of each upload session.
+        self.uploads: dict[str, dict] = {}
+        self.requests: dict[str, int] = {}
+        self.root_url: Union[str, None] = None
+
+    def add_file(self, name: str, parents: list[str],
+            mime_type: str = "application/pdf", file_id: Union[str, None] = None,
+            content: bytes = b"") -> dict:
+        """Add a file, and the change that added it."""
+        file_id = file_id or uuid4().hex
+        file = {
+            "kind": "drive#file",
+            "id": file_id,
+            "name": name,
+            "mimeType": mime_type,
+            "parents": parents,
+            "trashed": False,
+            "modifiedTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "webViewLink": f"https://drive.google.com/drive/folders/{file_id}"
+        }
+        with self.lock:
+            self.files[file["id"]] = file
+            for parent in parents:
+                self.children.setdefault(parent, []).append(file["id"])
+            self.contents[file["id"]] = content
+            self.record_change(file_id)
+        return file
+
+    def record_change(self, file_id: str):
+        """Add the change of the file to the feed, as removed if the file
+        is gone. Called with the lock held."""
+        file = self.files.get(file_id)
+        change = {"kind": "drive#change", "fileId": file_id,
+                  "removed": file is None}
+        if file is not None:
+            file["modifiedTime"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z",
+                                                 time.gmtime())
+            change["file"] = dict(file)
+        self.changes.append(change)
+
+    def rename_file(self, file_id: str, name: str) -> dict:
+        """Rename a file, and add the change."""
+        with self.lock:
+            self.files[file_id]["name"] = name
+            self.record_change(file_id)
+            return self.files[file_id]
+
+    def move_file(self, file_id: str, parents: list[str]) -> dict:
+        """Put a file in other folders, and add the change."""
+        with self.lock:
+            file = self.files[file_id]
+            for parent in file["parents"]:
+                self.children[parent].remove(file_id)
+            for parent in parents:
+                self.children.setdefault(parent, []).append(file_id)
+            file["parents"] = parents
+            self.record_change(file_id)
+            return file
+
+    def trash_file(self, file_id: str) -> dict:
+        """Move a file to the trash, and add the change."""
+        with self.lock:
+            self.files[file_id]["trashed"] = True
+            self.record_change(file_id)
+            return self.files[file_id]
+
+    def delete_file(self, file_id: str):
+        """Delete a file for good, and add the change that removed it."""
+        with self.lock:
+            file = self.files.pop(file_id)
+            for parent in file["parents"]:
+                self.children[parent].remove(file_id)
+            self.contents.pop(file_id, None)
+            self.record_change(file_id)
+
+    def expire_changes(self, status: int = 410):
+        """Answer `changes.list` with this status for the page tokens
+        given out so far, as drive does for tokens it no longer keeps."""
+        with self.lock:
+            self.expired_status = status
+            # The newest token given out is the count of the changes.
+            self.first_page_token = len(self.changes) + 1
+
+    def add_folder(self, name: str, parents: Union[list[str], None] = None
+            ) -> dict:
+        return self.add_file(name, parents or ["root"], FOLDER_MIME_TYPE)
+
+    def count(self, method: str):
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def inject(self) -> Union[Response, None]:
+        """Delay the request, and fail it at the configured rates."""
+        if self.latency > 0:
+            time.sleep(self.latency)
+        chance = self.random.random()
+        if chance < self.throttle_rate:
+            return error_response(429, "rateLimitExceeded", "Rate Limit Exceeded",
+                                  {"Retry-After": "1"})
+        if chance < self.throttle_rate + self.error_rate:
+            return error_response(500, "backendError", "Backend Error")
+        return None
+
+    def handle(self, method: str, url: str, headers: dict, body: bytes
+            ) -> Response:
+        """Answer a request, or one part of a batch request."""
+        parts = urlsplit(url)
+        path = parts.path
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if path.startswith("/batch/"):
+            self.count("batch")
+            return self.batch(headers, body)
+
+        if method == "POST" and path == "/upload/drive/v3/files":
+            name = "files.create"
+        elif path.startswith("/upload/session/"):
+            name = "files.create.chunk"
+        elif path == "/drive/v3/files":
+            name = "files.list"
+        elif path.endswith("/export"):
+            name = "files.export"
+        elif path.startswith("/drive/v3/files/"):
+            name = "files.get"
+        elif path == "/drive/v3/changes/startPageToken":
+            name = "changes.getStartPageToken"
+        elif path == "/drive/v3/changes":
+            name = "changes.list"
+        else:
+            return error_response(404, "notFound", f"No method at {path}")
+        self.count(name)
+        failure = self.inject()
+        if failure is not None:
+            return failure
+
+        if name == "files.list":
+            return self.list_files(query)
+        if name == "files.get":
+            file = self.files.get(path.rsplit("/", 1)[1])
+            if file is None:
+                return error_response(404, "notFound", "File not found")
+            return json_response(200, file)
+        if name == "files.export":
+            file_id = path.split("/")[-2]
+            if file_id not in self.files:
+                return error_response(404, "notFound", "File not found")
+            return 200, {"Content-Type": query.get("mimeType",
+                "application/octet-stream")}, self.contents[file_id]
+        if name == "files.create":
+            return self.start_upload(query, headers, body)
+        if name == "files.create.chunk":
+            return self.upload_chunk(path.rsplit("/", 1)[1], headers, body)
+        if name == "changes.getStartPageToken":
+            return json_response(200, {"kind": "drive#startPageToken",
+                                       "startPageToken": str(len(self.changes))})
+        return self.list_changes(query)
+
+    def search(self, q: str) -> list[dict]:
+        """The files that fit the query, as written by `drivereader.drive`."""
+        parent = re.search(r"'([^']*)' in parents", q)
+        name = re.search(r"name contains '([^']*)'", q)
+        mime_type = re.search(r"mimeType\s*=\s*'([^']*)'", q)
+        untrashed = "trashed = false" in q
+        with self.lock:
+            if parent is not None:
+                files = [self.files[file_id]
+                         for file_id in self.children.get(parent.group(1), [])]
+            else:
+                files = list(self.files.values())
+        return [
+            file for file in files
+            if (name is None or name.group(1) in file["name"])
+            and (mime_type is None or file["mimeType"] == mime_type.group(1))
+            and not (untrashed and file["trashed"])
+        ]
+
+    def list_files(self, query: dict) -> Response:
+        page_size = min(int(query.get("pageSize", 100)), 1000)
+        start = int(query.get("pageToken", 0))
+        files = self.search(query.get("q", ""))
+        body = {"kind": "drive#fileList", "incompleteSearch": False,
+                "files": files[start:start + page_size]}
+        if start + page_size < len(files):
+            body["nextPageToken"] = str(start + page_size)
+        return json_response(200, body)
+
+    def list_changes(self, query: dict) -> Response:
+        page_size = min(int(query.get("pageSize", 100)), 1000)
+        start = int(query["pageToken"])
+        if start < self.first_page_token:
+            return error_response(self.expired_status, "invalid",
+                                  "The page token is no longer valid")
+        body = {"kind": "drive#changeList",
+                "changes": self.changes[start:start + page_size]}
+        if start + page_size < len(self.changes):
+            body["nextPageToken"] = str(start + page_size)
+        else:
+            body["newStartPageToken"] = str(len(self.changes))
+        return json_response(200, body)
+
+    def start_upload(self, query: dict, headers: dict, body: bytes) -> Response:
+        if query.get("uploadType") != "resumable":
+            return error_response(400, "badRequest", "Only resumable uploads")
+        session = uuid4().hex
+        metadata = loads(body or b"{}")
+        self.uploads[session] = {
+            "metadata": metadata,
+            "mime_type": headers.get("x-upload-content-type",
+                                     "application/octet-stream"),
+            "size": int(headers.get("x-upload-content-length", -1)),
+            "content": bytearray()
+        }
+        return 200, {"Location": f"{self.root_url}upload/session/{session}",
+                     "Content-Length": "0"}, b""
+
+    def upload_chunk(self, session: str, headers: dict, body: bytes
+            ) -> Response:
+        upload = self.uploads.get(session)
+        if upload is None:
+            return error_response(404, "notFound", "Upload session not found")
+        content_range = headers.get("content-range", "")
+        match = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)", content_range)
+        if match is not None:
+            start = int(match.group(1))
+            if start == len(upload["content"]):
+                upload["content"].extend(body)
+            if match.group(3) != "*":
+                upload["size"] = int(match.group(3))
+        if len(upload["content"]) < upload["size"] or upload["size"] < 0:
+            received = {"Range": f"bytes=0-{len(upload['content']) - 1}"} \
+                if upload["content"] else {}
+            return 308, {**received, "Content-Length": "0"}, b""
+        del self.uploads[session]
+        file = self.add_file(
+            upload["metadata"].get("name", "Untitled"),
+            upload["metadata"].get("parents", ["root"]),
+            upload["mime_type"],
+            content=bytes(upload["content"])
+        )
+        return json_response(200, file)
+
+    def batch(self, headers: dict, body: bytes) -> Response:
+        """Answer each part of a batch request as a request of its own."""
+        content_type = headers.get("content-type", "")
+        message = BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        boundary = f"batch_{uuid4().hex}"
+        parts = []
+        for part in message.get_payload():
+            request = part.get_payload(decode=True)
+            head, _, inner_body = request.partition(b"\r\n\r\n")
+            if not _:
+                head, _, inner_body = request.partition(b"\n\n")
+            lines = head.decode().splitlines()
+            method, url, _ = lines[0].split(" ", 2)
+            inner_headers = {
+                key.strip().lower(): value.strip()
+                for key, value in (line.split(":", 1) for line in lines[1:] if ":" in line)
+            }
+            status, response_headers, response_body = self.handle(
+                method, url, inner_headers, inner_body)
+            content_id = part.get("Content-ID", "").strip("<>")
+            response_head = "".join(
+                f"{key}: {value}\r\n" for key, value in response_headers.items())
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\n{response_head}\r\n".encode()
+                + response_body + b"\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n".encode())
+        return 200, {"Content-Type": f"multipart/mixed; boundary={boundary}"}, \
+            b"".join(parts)
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        """Start answering requests in a thread.
+
+        Returns
+        -------
+        - ThreadingHTTPServer: The server, with the url to give to the
+            drive client in `root_url`.
+        """
+        drive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def answer(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                headers = {key.lower(): value for key, value in self.headers.items()}
+                status, response_headers, response_body = drive.handle(
+                    self.command, self.path, headers, body)
+                self.send_response(status)
+                for key, value in response_headers.items():
+                    self.send_header(key, value)
+                if "Content-Length" not in response_headers:
+                    self.send_header("Content-Length", str(len(response_body)))
+                self.end_headers()
+                self.wfile.write(response_body)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = answer
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        self.root_url = f"http://{host}:{server.server_address[1]}/"
+        server.root_url = self.root_url
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def populate(drive: FakeDrive, folder_count: int, files_per_folder: int,
+        codes: list[str], exempt_share: float = 0.05, seed: int = 0
+        ) -> list[str]:
+    """Fill the drive with folders of classified and exempted files.
+
+    Returns
+    -------
+    - list[str]: The names of the folders, as for `folders.json`.
+    """
+    rng = random.Random(seed)
+    names = []
+    for number in range(folder_count):
+        name = f"Benchmark Folder {number:04d}"
+        folder = drive.add_folder(name)
+        names.append(name)
+        for index in range(files_per_folder):
+            if rng.random() < exempt_share:
+                file_name = f"Scan {number}-{index}.pdf"
+            else:
+                file_name = (f"{rng.randint(2000, 2023)}{rng.randint(1, 12):02d}"
+                             f"{rng.randint(1, 28):02d}_{rng.choice(codes)}_"
+                             f"Document {number}-{index}.pdf")
+            drive.add_file(file_name, [folder["id"]])
+    return names
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--folders", type=int, default=10)
+    parser.add_argument("--files-per-folder", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0,
+        help="The milliseconds each request is delayed by.")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    from drivereader.codes import code_index
+    drive = FakeDrive(args.latency / 1000, args.error_rate, args.throttle_rate)
+    names = populate(drive, args.folders, args.files_per_folder,
+                     sorted(code_index().codes))
+    server = drive.serve(port=args.port)
+    print(f"Serving {len(drive.files)} files at {server.root_url}")
+    print(f"Folders: {dumps(names)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Break down where the time to start a worker goes.
+
+`main` is imported in a new interpreter run with `-X importtime`, and
+the time spent importing each package is added up, without the
+packages it imports in turn. The modules `main` imports itself are also
+listed with everything they import. With `--warm-up`, the api is then
+warmed up as it is before taking requests, which connects to the
+database in `DB_TOKEN`, and the steps timed by `drivereader.startup`
+are printed too.
+
+Run from the backend folder:
+
+    python -m benchmarks.startup --top 15 --output startup.json
+"""
+import argparse
+import subprocess
+import sys
+from json import dumps, loads
+
+# Written to stderr before `main` is imported, so that the imports of
+# the interpreter itself are left out.
+MARKER = "-- import main --"
+SCRIPT = f"""
+import asyncio
+import sys
+from json import dumps
+from time import perf_counter
+
+sys.stderr.write({MARKER!r} + "\\n")
+sys.stderr.flush()
+start = perf_counter()
+import main
+import_time = perf_counter() - start
+if sys.argv[1] == "warm-up":
+    async def warm_up():
+        async with main.lifespan(main.app):
+            pass
+    asyncio.run(warm_up())
+print(dumps({{"import_time": import_time, "steps": main.startup_steps}}))
+"""
+
+
+def parse_import_times(output: str) -> list[tuple[int, int, int, str]]:
+    """The imports logged by `-X importtime` after the marker.
+
+    Returns
+    -------
+    - list[tuple[int, int, int, str]]: The depth, own and cumulative
+        microseconds, and name of each module, in the order they
+        finished importing.
+    """
+    imports = []
+    lines = output.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1:]
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():
+            # The header.
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, int(own), int(cumulative), name.strip()))
+    return imports
+
+def break_down(imports: list[tuple[int, int, int, str]], top: int) -> dict:
+    total = sum(own for _, own, _, _ in imports)
+    packages: dict[str, int] = {}
+    for _, own, _, name in imports:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + own
+    # The modules imported by `main` itself finish just before it, one
+    # level deeper.
+    direct = []
+    for depth, _, cumulative, name in imports:
+        if depth == 1:
+            direct.append((name, cumulative))
+        elif depth == 0 and name == "main":
+            break
+    return {
+        "total_ms": round(total / 1000, 1),
+        "modules": len(imports),
+        "packages": [
+            {"package": package, "ms": round(own / 1000, 1),
+             "share": round(own / total, 3) if total else 0}
+            for package, own in sorted(packages.items(),
+                                       key=lambda item: -item[1])[:top]
+        ],
+        "main_imports": [
+            {"module": name, "ms": round(cumulative / 1000, 1)}
+            for name, cumulative in sorted(direct, key=lambda item: -item[1])
+        ]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--warm-up", action="store_true",
+        help="Also warm up the api, which connects to the database.")
+    parser.add_argument("--top", type=int, default=20,
+        help="The number of packages to list.")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    args = parser.parse_args()
+
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT,
+         "warm-up" if args.warm_up else "import"],
+        capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        print(process.stderr[-2000:], file=sys.stderr)
+        return process.returncode
+    timing = loads(process.stdout.strip().splitlines()[-1])
+    results = {
+        "import_time": round(timing["import_time"], 4),
+        "imports": break_down(parse_import_times(process.stderr), args.top),
+        "steps": timing["steps"]
+    }
+
+    imports = results["imports"]
+    print(f"import main: {results['import_time'] * 1000:.0f}ms wall, "
+          f"{imports['total_ms']}ms in {imports['modules']} modules")
+    print("by package:")
+    for package in imports["packages"]:
+        print(f"  {package['package']:<32} {package['ms']:>8}ms "
+              f"{package['share']:>6.1%}")
+    print("imported by main:")
+    for module in imports["main_imports"]:
+        print(f"  {module['module']:<32} {module['ms']:>8}ms")
+    if results["steps"]:
+        print("startup steps:")
+        for step, timing in results["steps"].items():
+            print(f"  {step:<32} {timing['seconds'] * 1000:>8.1f}ms "
+                  f"{timing['modules']:>4} modules")
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(dumps(results, indent=4))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,232 @@
+"""The `database` functions the api serves, on motor so that a request
+waiting for the database does not hold a worker thread."""
+from datetime import datetime
+from typing import Union
+
+import motor.motor_asyncio
+from pymongo import ReturnDocument, UpdateOne
+
+from drivereader.database import (
+    DB_NAME,
+    FILES_PROJECTION,
+    FILES_SORT,
+    NAAC_COUNT_SORT,
+    cache_valid_years,
+    cached_valid_years,
+    client_options,
+    command_metrics,
+    decode_files_cursor,
+    encode_files_cursor,
+    file_from_document,
+    files_query,
+    naac_count_operations,
+    naac_count_query,
+    password,
+)
+
+# The files read from the database at a time when streaming them.
+STREAM_BATCH_SIZE = 500
+
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    password, event_listeners=[command_metrics], **client_options)
+database = client[DB_NAME]
+files_data = database.files_data
+folders_data = database.folders_data
+exempt_data = database.exempt_data
+meta_data = database.meta_data
+naac_counts = database.naac_counts
+jobs_data = database.jobs_data
+
+
+async def fetch_naac_count(start_year: int, end_year: int):
+    """Fetch the naac related count for the website.
+
+    Parameters
+    ---------
+    - start_year `int`: The first year from which to look for
+    - end_year `int`: The last year to look for
+
+    Returns:
+        dict: Contains NAAC related sorted by year
+    """
+    files = {}
+    cursor = naac_counts.find(naac_count_query(start_year, end_year)) \
+        .sort(NAAC_COUNT_SORT)
+    async for row in cursor:
+        year_data = files.setdefault(row["year"], {})
+        year_data[row["classification"]] = row["count"]
+    return files
+
+async def fetch_all_files(code: Union[str, list[str], None], start_year: int,
+        end_year: int, limit: Union[int, None] = None,
+        after: Union[str, None] = None):
+    """Fetch the files of a range of years with a single query.
+
+    Parameters
+    ----------
+    - code `str | list[str] | None`: Only the files of this code, or of
+        any of these codes, if given.
+    - start_year `int`: The first year to look for.
+    - end_year `int`: The last year to look for.
+    - limit `int | None`: The most files to return.
+    - after `str | None`: The cursor returned with the previous page.
+
+    Returns
+    -------
+    - dict: The files by year.
+    - str | None: The cursor of the next page, None if there are no
+        more files.
+    """
+    files_list, cursor = {}, None
+    async for file in find_files(code, start_year, end_year, limit, after):
+        cursor = encode_files_cursor(file)
+        files_list.setdefault(file["year"], []).append(file_from_document(file))
+    count = sum(len(files) for files in files_list.values())
+    if limit is None or count < limit:
+        cursor = None
+    return files_list, cursor
+
+async def stream_files(code: Union[str, None], start_year: int, end_year: int,
+        after: Union[str, None] = None):
+    """Yield the files of a range of years one at a time, in batches of
+    `STREAM_BATCH_SIZE` from the database."""
+    async for file in find_files(code, start_year, end_year, after=after,
+            batch_size=STREAM_BATCH_SIZE):
+        cursor = encode_files_cursor(file)
+        file = file_from_document(file)
+        file["cursor"] = cursor
+        yield file
+
+def find_files(code: Union[str, list[str], None], start_year: int, end_year: int,
+        limit: Union[int, None] = None, after: Union[str, None] = None,
+        batch_size: int = 0):
+    """The cursor over the files of a range of years, see
+    `database.files_query`.
+
+    Raises
+    ------
+    - ValueError: If `after` is not a valid cursor.
+    """
+    cursor = files_data.find(
+        files_query(
+            code, start_year, end_year,
+            decode_files_cursor(after) if after is not None else None
+        ),
+        FILES_PROJECTION,
+        batch_size=batch_size
+    ).sort(FILES_SORT)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return cursor
+
+def find_names():
+    """The cursors over the name, year and code of every classified and
+    exempted file, by the kind of file."""
+    return {
+        "file": files_data.find({}, {"name": 1, "year": 1, "code": 1},
+                                batch_size=STREAM_BATCH_SIZE),
+        "exempt": exempt_data.find({}, {"name": 1},
+                                   batch_size=STREAM_BATCH_SIZE)
+    }
+
+async def fetch_all_folders():
+    return await folders_data.find().to_list(None)
+
+async def bump_generation():
+    """Note that the data has changed, see `database.bump_generation`."""
+    await meta_data.update_one(
+        {"_id": "generation"},
+        {"$inc": {"value": 1}},
+        True
+    )
+
+async def fetch_generation() -> int:
+    document = await meta_data.find_one({"_id": "generation"})
+    return document.get("value", 0) if document is not None else 0
+
+async def fetch_job_document(job_id: str):
+    return await jobs_data.find_one({"_id": job_id})
+
+async def fail_job_document(job_id: str, error: str):
+    """Mark a job that has not finished as failed, see
+    `database.fail_job_document`."""
+    await jobs_data.update_one(
+        {"_id": job_id, "status": {"$nin": ["done", "failed"]}},
+        {"$set": {
+            "status": "failed",
+            "error": error,
+            "finished_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }}
+    )
+
+async def fetch_lock(name: str) -> Union[dict, None]:
+    return await meta_data.find_one({"_id": name})
+
+async def get_valid_years() -> tuple[Union[int, None], Union[int, None]]:
+    """Get the valid years searches can happen, see
+    `database.get_valid_years`."""
+    years = cached_valid_years()
+    if years is not None:
+        return years
+    document = await meta_data.find_one({"_id": "year_bounds"})
+    if document is None:
+        return await refresh_valid_years()
+    return cache_valid_years((document.get("min_year"), document.get("max_year")))
+
+async def refresh_valid_years() -> tuple[Union[int, None], Union[int, None]]:
+    """Find the valid years again and save them in `meta_data`."""
+    years = []
+    for order in (1, -1):
+        row = await naac_counts.find_one(
+            {"code": {"$exists": True}},
+            {"year": 1},
+            sort=[("year", order)]
+        )
+        years.append(row.get("year") if row is not None else None)
+    await meta_data.update_one(
+        {"_id": "year_bounds"},
+        {"$set": {"min_year": years[0], "max_year": years[1]}},
+        True
+    )
+    return cache_valid_years(years)
+
+async def upsert_document(collection, file_details: dict):
+    key = {"_id": file_details.pop("id")}
+    await collection.update_one(key, {"$set": file_details}, True)
+    return {**key, **file_details}
+
+async def create_file_document(file_details: dict):
+    """Insert or update a file, and apply the change to `naac_counts`.
+
+    The year and code the file had are returned by the write itself, so
+    that a file written by another worker at the same time is not
+    counted twice.
+    """
+    key = {"_id": file_details.pop("id")}
+    previous = await files_data.find_one_and_update(
+        key, {"$set": file_details}, {"year": 1, "code": 1}, upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    document = {**key, **file_details}
+    operations: list[UpdateOne] = naac_count_operations([(
+        (previous.get("year"), previous.get("code"))
+            if previous is not None else None,
+        (document.get("year"), document.get("code"))
+    )])
+    if len(operations) != 0:
+        await naac_counts.bulk_write(operations, ordered=False)
+        await naac_counts.delete_many({"count": {"$lte": 0}})
+        await refresh_valid_years()
+    await bump_generation()
+    return document
+
+async def create_exempt_document(file_details: dict):
+    document = await upsert_document(exempt_data, file_details)
+    await bump_generation()
+    return document
+
+async def create_folder_document(folder_details: dict):
+    document = await upsert_document(folders_data, folder_details)
+    await bump_generation()
+    return document
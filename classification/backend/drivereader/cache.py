@@ -0,0 +1,175 @@
+"""A cache of query results in each worker, cleared whenever any worker
+changes the data."""
+import asyncio
+import os
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Awaitable, Callable, Hashable, Union
+
+from drivereader.async_database import fetch_generation
+from drivereader.codes import reload_code_index
+from drivereader.database import forget_valid_years
+
+# The most results kept by a worker.
+CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 256))
+# The seconds a result is kept even if the data does not change.
+CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 300))
+# The seconds between reads of the data generation.
+GENERATION_POLL = float(os.getenv("GENERATION_POLL", 1))
+# The most files held by all the results kept by a worker, so that a
+# few lists of all the files cannot take up its memory. A result with
+# more files than this is not kept.
+CACHE_FILES = int(os.getenv("RESULT_CACHE_FILES", 50000))
+
+
+def count_files(result: tuple[dict[int, list], Any]) -> int:
+    """The number of files in a result of `fetch_all_files`."""
+    return sum(len(files) for files in result[0].values())
+
+
+class ResultCache():
+    """A bounded LRU cache of query results, with a time to live.
+
+    Every result is stored with the data generation it was computed
+    at. The generation in `meta_data` is read at most once every
+    `poll_interval` seconds, and the cache is cleared when it has gone
+    up, so a write by any worker is seen by all of them within that
+    time.
+
+    The results are bounded both in number and in the files they hold
+    all together, the least recently used going first.
+
+    Calls for a result that is already being computed wait for that
+    computation instead of starting their own. It runs in a task of its
+    own, so that it goes on for the others when the call that started
+    it is cancelled.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+            poll_interval: float = GENERATION_POLL,
+            fetch_generation: Callable[[], Awaitable[int]] = fetch_generation,
+            max_files: int = CACHE_FILES) -> None:
+        self.max_size = max_size
+        self.max_files = max_files
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.fetch_generation = fetch_generation
+        # The generation, value, time stored and number of files of each
+        # result.
+        self.entries: OrderedDict[Hashable, tuple[int, Any, float, int]] = OrderedDict()
+        self.files = 0
+        self.pending: dict[Hashable, asyncio.Task] = {}
+        self.generation: Union[int, None] = None
+        self.generation_read_at = float("-inf")
+        self.generation_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def current_generation(self) -> int:
+        """The data generation, read again if it is older than the poll
+        interval. The cache is cleared if it has changed."""
+        if monotonic() - self.generation_read_at < self.poll_interval:
+            return self.generation
+        async with self.generation_lock:
+            if monotonic() - self.generation_read_at >= self.poll_interval:
+                generation = await self.fetch_generation()
+                if self.generation is not None and generation != self.generation:
+                    self.invalidate()
+                self.generation = generation
+                self.generation_read_at = monotonic()
+        return self.generation
+
+    def invalidate(self):
+        """Drop all the results, and the valid years of the worker.
+
+        The codes are read again too if the sheet was read by another
+        worker.
+        """
+        self.entries.clear()
+        self.files = 0
+        forget_valid_years()
+        reload_code_index()
+        self.invalidations += 1
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]],
+            size: Union[Callable[[Any], int], None] = None):
+        """Get the result for the key, computing it if it is not cached.
+
+        Parameters
+        ----------
+        - key `Hashable`: The name of the query and its arguments.
+        - compute `Callable[[], Awaitable]`: Makes the result.
+        - size `Callable[[Any], int] | None`: Counts the files in a
+            result, against `max_files`. A result counts as one file
+            if not given.
+
+        Returns
+        -------
+        - Any: The result, which must not be changed by the caller.
+        """
+        generation = await self.current_generation()
+        entry = self.entries.get(key)
+        if (entry is not None and entry[0] == generation
+                and monotonic() - entry[2] < self.ttl):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        if key in self.pending:
+            self.waits += 1
+            return await asyncio.shield(self.pending[key])
+
+        self.misses += 1
+        task = asyncio.ensure_future(compute())
+        self.pending[key] = task
+        task.add_done_callback(
+            lambda task: self.finish(key, generation, task, size))
+        return await asyncio.shield(task)
+
+    def finish(self, key: Hashable, generation: int, task: asyncio.Task,
+            size: Union[Callable[[Any], int], None]):
+        """Keep the result of a computation once it is done."""
+        del self.pending[key]
+        # Nobody may be waiting, so an error must not be reported as
+        # never retrieved.
+        if task.cancelled() or task.exception() is not None:
+            return
+        value = task.result()
+        self.store(key, generation, value, 1 if size is None else size(value))
+
+    def store(self, key: Hashable, generation: int, value: Any, files: int = 1):
+        if generation != self.generation:
+            # The data changed while the value was being computed.
+            return
+        if key in self.entries:
+            self.files -= self.entries.pop(key)[3]
+        if files > self.max_files:
+            return
+        self.entries[key] = (generation, value, monotonic(), files)
+        self.files += files
+        while len(self.entries) > self.max_size or self.files > self.max_files:
+            self.files -= self.entries.popitem(last=False)[1][3]
+            self.evictions += 1
+
+    def stats(self) -> dict[str, Union[int, float, None]]:
+        """The use of the cache since the worker started."""
+        lookups = self.hits + self.misses + self.waits
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "files": self.files,
+            "max_files": self.max_files,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "waits": self.waits,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.waits) / lookups, 4) if lookups else None
+        }
+
+
+result_cache = ResultCache()
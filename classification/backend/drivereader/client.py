@@ -0,0 +1,192 @@
+"""The drive client shared by the whole process."""
+import logging
+import threading
+from datetime import datetime, timedelta
+from json import load
+from os import getenv, path, remove
+from time import perf_counter
+from typing import Union
+
+import httplib2
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document, Resource
+from googleapiclient.discovery_cache import DISCOVERY_DOC_DIR
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from drivereader.metrics import drive_request_duration
+
+# If modifying these scopes, delete the file token.json.
+SCOPES = [
+    "https://www.googleapis.com/auth/drive"
+]
+# Refresh the credentials this long before they expire.
+REFRESH_MARGIN = timedelta(minutes=5)
+# The seconds to wait for drive to respond.
+HTTP_TIMEOUT = 60
+# Another server to send the drive requests to, like the fake drive of
+# the benchmarks. It is called without credentials.
+DRIVE_ROOT_URL = getenv("DRIVE_ROOT_URL")
+
+# Using the logs.
+logger_monitor = logging.getLogger(__name__)
+logger_monitor.setLevel(logging.ERROR)
+handler = logging.FileHandler("drive_reader_logs.log", delay=True)
+handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
+logger_monitor.addHandler(handler)
+
+
+class TimedHttpRequest(HttpRequest):
+    """A drive api call that records how long it took, by method."""
+
+    def timed(self, call, *args, **kwargs):
+        start = perf_counter()
+        status = "ok"
+        try:
+            return call(*args, **kwargs)
+        except HttpError as error:
+            status = str(error.resp.status)
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            drive_request_duration.observe(
+                perf_counter() - start, self.methodId or "", status)
+
+    def execute(self, *args, **kwargs):
+        return self.timed(super().execute, *args, **kwargs)
+
+    def next_chunk(self, *args, **kwargs):
+        return self.timed(super().next_chunk, *args, **kwargs)
+
+
+class DriveClient():
+    """Hold the drive credentials in memory and hand out services.
+
+    The credentials are read from `token.json` once, and refreshed
+    before they expire. Each thread gets its own service, since the
+    http transport of a service must not be shared between threads, and
+    keeps it so that its connections are reused.
+
+    If a `root_url` is given, the requests go to that server instead of
+    drive, without credentials.
+    """
+
+    def __init__(self, token_file: str = "token.json",
+            secrets_file: str = "credentials.json",
+            root_url: Union[str, None] = DRIVE_ROOT_URL) -> None:
+        self.token_file = token_file
+        self.secrets_file = secrets_file
+        self.root_url = root_url
+        self.credentials: Union[Credentials, None] = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def load_credentials(self) -> Union[Credentials, None]:
+        """Read the credentials from the token, or ask the user to login."""
+        credentials = None
+        if path.exists(self.token_file):
+            credentials = Credentials.from_authorized_user_file(
+                self.token_file,
+                SCOPES
+            )
+
+        if not credentials or not credentials.valid:
+            if (credentials and credentials.expired
+                    and credentials.refresh_token
+                    and self.refresh_credentials(credentials)):
+                return credentials
+            # Only needed to login, so not loaded with the client.
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            try:
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    self.secrets_file, SCOPES)
+            except FileNotFoundError:
+                print("Credential file not found.")
+                return None
+            credentials = flow.run_local_server(port=0)
+            self.save_credentials(credentials)
+        return credentials
+
+    def refresh_credentials(self, credentials: Credentials) -> bool:
+        """Refresh the credentials and save them for the next run."""
+        try:
+            credentials.refresh(Request())
+        except RefreshError:
+            logger_monitor.exception("The drive token could not be refreshed.")
+            if path.exists(self.token_file):
+                remove(self.token_file)
+            return False
+        self.save_credentials(credentials)
+        return True
+
+    def save_credentials(self, credentials: Credentials):
+        with open(self.token_file, "w") as token:
+            token.write(credentials.to_json())
+
+    def get_credentials(self) -> Union[Credentials, None]:
+        """The credentials, refreshed if they are about to expire."""
+        with self.lock:
+            if self.credentials is None:
+                self.credentials = self.load_credentials()
+            credentials = self.credentials
+            if (credentials is not None and credentials.expiry is not None
+                    and credentials.expiry - datetime.utcnow() < REFRESH_MARGIN):
+                if not self.refresh_credentials(credentials):
+                    self.credentials = credentials = self.load_credentials()
+                    # Services built with the old credentials are stale.
+                    self.local = threading.local()
+            return credentials
+
+    def service(self) -> Union[Resource, None]:
+        """The drive service of the calling thread."""
+        if self.root_url is not None:
+            return self.local_service()
+        credentials = self.get_credentials()
+        if credentials is None:
+            return None
+        local = self.local
+        service = getattr(local, "service", None)
+        if service is None:
+            http = AuthorizedHttp(credentials, http=make_http())
+            # The discovery document bundled with the library is used,
+            # so building the service needs no request.
+            service = build(
+                "drive", "v3",
+                http=http,
+                static_discovery=True,
+                cache_discovery=False,
+                requestBuilder=TimedHttpRequest
+            )
+            local.service = service
+        return service
+
+    def local_service(self) -> Resource:
+        """The service of the calling thread for the server at `root_url`."""
+        service = getattr(self.local, "service", None)
+        if service is None:
+            with open(path.join(DISCOVERY_DOC_DIR, "drive.v3.json")) as file:
+                document = load(file)
+            root_url = self.root_url.rstrip("/") + "/"
+            document["rootUrl"] = document["mtlsRootUrl"] = root_url
+            document["baseUrl"] = root_url + document["servicePath"]
+            service = build_from_document(document, http=make_http(),
+                                          requestBuilder=TimedHttpRequest)
+            self.local.service = service
+        return service
+
+
+def make_http() -> httplib2.Http:
+    """The http transport of a service."""
+    http = httplib2.Http(timeout=HTTP_TIMEOUT)
+    # Drive answers each chunk of a resumable upload with a 308, which
+    # is not a redirect.
+    http.redirect_codes = http.redirect_codes - {308}
+    return http
+
+
+drive_client = DriveClient()
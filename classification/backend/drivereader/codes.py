@@ -0,0 +1,117 @@
+"""The codes of the classification sheet, held in memory by each worker.
+
+The index is never changed once made. When the sheet is read again a
+new index is made and put in place of the old one, so a caller that
+keeps the index it got sees the same codes throughout.
+"""
+import logging
+from json import load
+from os import path
+from types import MappingProxyType
+from typing import Union
+
+from drivereader._type import Category, Classification, Code, Name
+
+CODE_LIST_FILE = "data/code_list.json"
+
+# Using the logs.
+logger_monitor = logging.getLogger(__name__)
+logger_monitor.setLevel(logging.ERROR)
+handler = logging.FileHandler("drive_reader_logs.log", delay=True)
+handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
+logger_monitor.addHandler(handler)
+
+
+class CodeIndex():
+    """The codes and classifications of the sheet, looked up both ways.
+
+    Parameters
+    ----------
+    - code_list `dict`: The name, category and classifications of each
+        code, as written to `code_list.json`.
+    - modified_time `float | None`: The time `code_list.json` was
+        modified when it was read.
+    """
+
+    __slots__ = ("code_list", "names", "categories", "classifications",
+                 "codes_by_classification", "codes", "modified_time")
+
+    def __init__(self,
+            code_list: dict[Code, tuple[Name, Category, list[Classification]]],
+            modified_time: Union[float, None] = None) -> None:
+        self.code_list = MappingProxyType({
+            code: (name, category, tuple(classifications))
+            for code, (name, category, classifications) in code_list.items()
+        })
+        self.names: MappingProxyType[Code, Name] = MappingProxyType({
+            code: values[0] for code, values in self.code_list.items()
+        })
+        self.categories: MappingProxyType[Code, Category] = MappingProxyType({
+            code: values[1] for code, values in self.code_list.items()
+        })
+        self.classifications: MappingProxyType[Code, tuple[Classification, ...]] \
+            = MappingProxyType({
+                code: values[2] for code, values in self.code_list.items()
+            })
+        # The codes of each classification in order, once each, as
+        # `code_list.json` can list a classification twice for a code.
+        codes_by_classification: dict[Classification, dict[Code, None]] = {}
+        for code, classifications in self.classifications.items():
+            for classification in classifications:
+                codes_by_classification.setdefault(classification, {})[code] = None
+        self.codes_by_classification: \
+            MappingProxyType[Classification, tuple[Code, ...]] = MappingProxyType({
+                classification: tuple(codes)
+                for classification, codes in codes_by_classification.items()
+            })
+        # The codes a file name can be classified with.
+        self.codes: frozenset[Code] = frozenset(self.code_list)
+        self.modified_time = modified_time
+
+    def __contains__(self, code: Code) -> bool:
+        return code in self.codes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+def read_code_index() -> CodeIndex:
+    """Make the index from `code_list.json`."""
+    try:
+        modified_time = path.getmtime(CODE_LIST_FILE)
+        with open(CODE_LIST_FILE, "r") as code_info:
+            return CodeIndex(load(code_info), modified_time)
+    except FileNotFoundError:
+        logger_monitor.warning("Code list not found.")
+        return CodeIndex({})
+
+
+# Read on first use, or when the api warms up.
+_code_index: Union[CodeIndex, None] = None
+
+def code_index() -> CodeIndex:
+    """The index of the codes in use by the worker."""
+    if _code_index is None:
+        swap_code_index(read_code_index())
+    return _code_index
+
+def swap_code_index(index: CodeIndex):
+    """Put the index in use in place of the current one."""
+    global _code_index
+    _code_index = index
+
+def reload_code_index() -> CodeIndex:
+    """Read `code_list.json` again if another worker has written it
+    since it was read by this one.
+
+    Returns
+    -------
+    - CodeIndex: The index in use.
+    """
+    try:
+        modified_time = path.getmtime(CODE_LIST_FILE)
+    except FileNotFoundError:
+        return code_index()
+    if _code_index is None or modified_time != _code_index.modified_time:
+        swap_code_index(read_code_index())
+    return _code_index
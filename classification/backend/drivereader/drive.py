@@ -3,20 +3,22 @@ from __future__ import print_function
 
 # Import in-built modules.
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from hashlib import sha256
 from io import BytesIO
 from json import dumps, load
-from os import path, remove
-from os import system
+from os import getenv, path, system
 from sys import exit
-from typing import TypeVar, Union
+from uuid import uuid4
+from time import perf_counter
+from typing import Callable, TypeVar, Union
 
 # Import project specific modules.
+import httplib2
 from fastapi import UploadFile
-from google.auth.exceptions import RefreshError
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build, Resource
+from fastapi.concurrency import run_in_threadpool
+from googleapiclient.discovery import Resource
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 
@@ -24,61 +26,53 @@ from drivereader._type import (
     BaseFile,
     FileFull,
     Folder,
-    CodeList,
 )
+from drivereader.client import drive_client
+from drivereader.codes import reload_code_index
+from drivereader.metrics import observe_drive_request, scan_files, scan_pages
 from drivereader.util import sort_dictionary
 from drivereader.database import (
+    BulkWriter,
+    ScanSnapshot,
     create_folder_document,
     create_file_document,
-    create_exempt_document
+    create_exempt_document,
+    fetch_all_folders,
+    fetch_meta_document,
+    fetch_resolved_folders,
+    fetch_stored_ids,
+    fetch_upload_document,
+    remove_exempt_document,
+    remove_file_document,
+    update_meta_document,
+    update_upload_document
 )
 
-# If modifying these scopes, delete the file token.json.
-SCOPES = [
-    "https://www.googleapis.com/auth/drive"
-]
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+UPLOAD_FOLDER_ID = "1jdXUkSPl06axEnaTQryyQuMx9tZlGghX" # Events folder
+# The names of the folders to scan.
+FOLDERS_FILE = getenv("FOLDERS_FILE", "data/folders.json")
+# The most files drive lists in one page.
+PAGE_SIZE = 1000
+# The number of folders listed at the same time by a parallel scan.
+SCAN_CONCURRENCY = int(getenv("SCAN_CONCURRENCY", 4))
+# The most requests drive accepts in one batch request.
+BATCH_LIMIT = 100
+# How long the ids of the folders in `folders.json` are trusted.
+FOLDER_CACHE_TTL = timedelta(hours=float(getenv("FOLDER_CACHE_HOURS", 24*7)))
+# The bytes sent to drive at a time, a multiple of 256 KB.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
 
 # Using the logs.
 logger_monitor = logging.getLogger(__name__)
 logger_monitor.setLevel(logging.ERROR)
-handler = logging.FileHandler("drive_reader_logs.log")
+handler = logging.FileHandler("drive_reader_logs.log", delay=True)
 handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
 logger_monitor.addHandler(handler)
 
 def make_connection() -> Union[Resource, None]:
     """Provide service to connect with the drive."""
-    credentials = None
-    if path.exists("token.json"):
-        credentials = Credentials.from_authorized_user_file(
-            "token.json",
-            SCOPES
-        )
-
-    if not credentials or not credentials.valid:
-        refresh = False
-        if (credentials and credentials.expired
-                and credentials.refresh_token):
-            try:
-                credentials.refresh(Request())
-            except RefreshError:
-                remove("token.json")
-            else:
-                refresh = True
-        if refresh is False:
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    "credentials.json", SCOPES)
-            except FileNotFoundError:
-                print("Credential file not found.")
-                return None
-            credentials = flow.run_local_server(port=0)
-        # Save the credentials for the next run.
-        with open("token.json", "w") as token:
-            token.write(credentials.to_json())
-
-    # Create a connection with drive.
-    service = build("drive", "v3", credentials=credentials)
-    return service
+    return drive_client.service()
 
 def search_file_by_name(file_name: str, service=None) -> Union[BaseFile, None]:
     """Search for a specific file."""
@@ -120,11 +114,152 @@ def search_folder(category_name: str, service=None) -> Folder:
         logger_monitor.exception(f"An error occurred: {error}")
         return None
 
+def batch_list(queries: list[str], service: Resource, fields: str):
+    """List the files of many queries with batch requests.
+
+    Drive answers up to `BATCH_LIMIT` queries in one http request.
+
+    Parameters
+    ----------
+    - queries `list[str]`: The search queries.
+    - service `Resource`: The service to use.
+    - fields `str`: The fields of the files to return.
+
+    Returns
+    -------
+    - list[list[dict] | None]: The files found by each query, None if
+        the query failed.
+    """
+    results: list[Union[list[dict], None]] = [None] * len(queries)
+
+    def store_result(request_id: str, response: dict, exception: HttpError):
+        if exception is not None:
+            logger_monitor.error(f"An error occurred: {exception}")
+            return
+        results[int(request_id)] = response.get("files", [])
+
+    for start in range(0, len(queries), BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=store_result)
+        for index in range(start, min(start + BATCH_LIMIT, len(queries))):
+            batch.add(
+                service.files().list(q=queries[index], fields=fields),
+                request_id=str(index)
+            )
+        batch_start = perf_counter()
+        try:
+            batch.execute()
+        except HttpError as error:
+            observe_drive_request("drive.batch", batch_start,
+                                  str(error.resp.status))
+            logger_monitor.exception(f"An error occurred: {error}")
+        else:
+            observe_drive_request("drive.batch", batch_start)
+    return results
+
+def search_files_by_name(file_names: list[str], service=None
+        ) -> dict[str, Union[BaseFile, None]]:
+    """Search for many files at once, see `search_file_by_name`."""
+    if service is None:
+        service = make_connection()
+        if service is None:
+            return {}
+    results = batch_list(
+        [f"name contains '{name}'" for name in file_names],
+        service,
+        "files(id, name, mimeType)"
+    )
+    return {
+        name: files[0] if files else None
+        for name, files in zip(file_names, results)
+    }
+
+def search_folders(category_names: list[str], service=None
+        ) -> dict[str, Union[Folder, None]]:
+    """Search for many folders at once, see `search_folder`."""
+    if service is None:
+        service = make_connection()
+        if service is None:
+            return {}
+    results = batch_list(
+        [
+            f"name contains '{name}' and mimeType = '{FOLDER_MIME_TYPE}'"
+            for name in category_names
+        ],
+        service,
+        "files(id, name, mimeType, webViewLink)"
+    )
+    return {
+        name: folders[0] if folders else None
+        for name, folders in zip(category_names, results)
+    }
+
+def resolve_folders(folder_names: list[str], service=None
+        ) -> tuple[dict[str, str], list[str]]:
+    """Find the ids of the folders named in `folders.json`.
+
+    The folders found are saved in `folders_data` with the name they
+    were searched by and when. As long as `folders.json` is unchanged,
+    folders found within `FOLDER_CACHE_TTL` are not searched again.
+
+    Parameters
+    ----------
+    - folder_names `list[str]`: The names of the folders.
+    - service `Resource | None`: The service to use.
+
+    Returns
+    -------
+    - dict[str, str]: The name in `folders.json` of each folder found,
+        by its id.
+    - list[str]: The names in `folders.json` no folder was found for.
+    """
+    config_hash = sha256(dumps(folder_names).encode()).hexdigest()
+    state = fetch_meta_document("folders_config")
+    cached = {}
+    if state is not None and state.get("hash") == config_hash:
+        cached = fetch_resolved_folders(
+            folder_names,
+            datetime.utcnow() - FOLDER_CACHE_TTL
+        )
+
+    missing = [name for name in folder_names if name not in cached]
+    if len(missing) != 0:
+        now = datetime.utcnow()
+        for search_name, folder in search_folders(missing, service).items():
+            if folder is None:
+                logger_monitor.error(f"Folder {search_name} was not found.")
+                continue
+            cached[search_name] = create_folder_document({
+                **folder,
+                "search_name": search_name,
+                "resolved_at": now
+            })
+        update_meta_document("folders_config", {"hash": config_hash})
+
+    folders = {
+        cached[name]["_id"]: name
+        for name in folder_names if name in cached
+    }
+    return folders, [name for name in folder_names if name not in cached]
+
 def download_classification_sheet():
-    """Download the required excel sheet."""
+    """Download the required excel sheet.
+
+    The sheet is not downloaded again if it has not been modified in
+    drive since the last download.
+    """
     service = make_connection()
     EXCEL_SHEET_ID = "1b5yJfOIWCHXdr7VbFxoNLs_SI5zPR7CL0MsCI1zqWaM"
     try:
+        modified_time = service.files().get(
+            fileId=EXCEL_SHEET_ID,
+            fields="modifiedTime"
+        ).execute().get("modifiedTime")
+        state = fetch_meta_document("classification_sheet") or {}
+        if (modified_time is not None
+                and state.get("modified_time") == modified_time
+                and path.exists("data/doc_classification.xlsx")):
+            return True
+
         mime_type = "application/vnd.openxmlformats-officedocument"
         mime_type += ".spreadsheetml.sheet"
         request = service.files().export_media(fileId=EXCEL_SHEET_ID,
@@ -145,80 +280,359 @@ def download_classification_sheet():
             except FileNotFoundError:
                 system("MKDIR data")
             else:
+                update_meta_document("classification_sheet", {
+                    "modified_time": modified_time
+                })
                 return True
 
     except HttpError as error:
         logger_monitor.exception(f"{error} has occurred.")
     return False
 
-def scan_drive():
+def scan_drive(parallel: bool = True,
+        on_progress: Union[Callable[[dict], None], None] = None):
+    """Scan all the files in the folders of `folders.json` and update
+    the data.
+
+    Parameters
+    ----------
+    - parallel `bool`: Whether to list the folders at the same time,
+        `SCAN_CONCURRENCY` at a time.
+    - on_progress `Callable[[dict], None] | None`: Called with the
+        folders done, files processed and errors so far, after each
+        folder.
+
+    Only the files that are new or changed since they were stored are
+    written, see `ScanSnapshot`. If every folder was listed without an
+    error, the stored files of the folders that were not listed are
+    removed, as they were trashed, deleted or moved out of the folders.
+
+    Returns
+    -------
+    - dict: The count of files the program has scanned, how many were
+        unchanged, updated, inserted and removed, and the time taken to
+        list each folder.
+    """
+    start = perf_counter()
     service = make_connection()
-    with open("data/code_list.json", "r") as code_data:
-        code_list = load(code_data)
+    codes = reload_code_index().codes
     try:
-        with open("data/folders.json", "r") as file:
+        with open(FOLDERS_FILE, "r") as file:
             folder_names: list[str] = load(file)
     except FileNotFoundError:
         logger_monitor.exception("Please specify the folders to search in `folders.json`.")
         return None
 
-    folders, files = [], []
-    folder_count, file_count, exempt_count, total_count = 0, 0, 0, 0
-    for folder_search in folder_names:
-        folder = search_folder(folder_search, service)
-        folder = create_folder_document(folder)
-        folder_id = folder.get("_id")
-        folders.append(folder.get("name"))
-        folder_count += 1
+    # Note where the changes start before scanning, so that nothing
+    # done during the scan is missed by the next incremental sync.
+    start_page_token = fetch_start_page_token(service)
+    writer = BulkWriter()
+    snapshot = ScanSnapshot()
 
-        try:
-            page_token = None
-            while True:
-                # Search for all files with the folder as parent.
-                response = service.files().list(
-                    q=f"'{folder_id}' in parents and trashed = false",
-                    spaces='drive',
-                    fields='nextPageToken, files(id, name, mimeType)',
-                    pageToken=page_token
-                ).execute()
-                total_count += len(response.get("files"))
-
-                for file in response.get("files"):
-                    file: BaseFile
-                    name = file.get("name")
-                    if (name.lower().startswith("read") is False and
-                            name is not None):
-                        year, code = file_details_from_name(file.get("name"), code_list)
-                        file["parent"] = folder_id
-                        if year is not None and code is not None:
-                            file["year"] = year
-                            file["code"] = code
-                            create_file_document(file)
-                            files.append(file.get("name"))
-                            file_count += 1
-                        else:
-                            create_exempt_document(file)
-                            exempt_count += 1
-                page_token = response.get("nextPageToken", None)
-
-                if page_token is None:
-                    break
+    folders, unresolved = resolve_folders(folder_names, service)
 
-        except HttpError as error:
-            logger_monitor.exception(f"An error occurred: {error}")
+    # The stats of each folder, by its name in `folders.json`.
+    folder_stats = {}
+    errors = [f"Folder {name} was not found." for name in unresolved]
+    file_count, exempt_count, total_count = 0, 0, 0
+
+    def store_folder_files(folder_id: str, listing: tuple[list[BaseFile], dict]):
+        nonlocal file_count, exempt_count, total_count
+        files, stats = listing
+        total_count += len(files)
+        folder_stats[folders[folder_id]] = stats
+        scan_pages.inc("full", amount=stats["page_count"])
+        for file in files:
+            kind = classify_file(file, folder_id, codes, writer, snapshot)
+            if kind == "file":
+                file_count += 1
+            elif kind == "exempt":
+                exempt_count += 1
+            if kind is not None:
+                scan_files.inc("full", kind)
+        if stats["error"] is not None:
+            errors.append(f"{folders[folder_id]}: {stats['error']}")
+        if on_progress is not None:
+            on_progress({
+                "folder_count": len(folders),
+                "folders_done": len(folder_stats),
+                "files_processed": total_count,
+                "errors": errors
+            })
+
+    if parallel and len(folders) > 1:
+        # Only the listing happens in the threads, the files are stored
+        # here as each folder completes.
+        with ThreadPoolExecutor(
+                max_workers=min(SCAN_CONCURRENCY, len(folders))) as executor:
+            listings = {
+                executor.submit(list_folder_files, folder_id): folder_id
+                for folder_id in folders
+            }
+            for listing in as_completed(listings):
+                store_folder_files(listings[listing], listing.result())
+    else:
+        for folder_id in folders:
+            store_folder_files(folder_id, list_folder_files(folder_id, service))
+
+    # A folder that was not found or listed in full may hold files that
+    # were not listed, so nothing is removed then.
+    removed_count = 0
+    if len(errors) == 0:
+        for kind, file_ids in snapshot.unlisted(set(folders)).items():
+            for file_id in file_ids:
+                if kind == "file":
+                    remove_file_document(file_id, writer)
+                else:
+                    remove_exempt_document(file_id, writer)
+                removed_count += 1
+    writer.flush()
+    if start_page_token is not None:
+        update_meta_document("drive_changes", {"page_token": start_page_token})
+
+    return {
+        "mode": "full",
+        "folder_count": len(folders),
+        "file_count": file_count,
+        "exempt_count": exempt_count,
+        "total_count": total_count,
+        "removed_count": removed_count,
+        **snapshot.summary(),
+        **writer.summary(),
+        "scan_time": round(perf_counter() - start, 4),
+        "folders": folder_stats
+    }
+
+def list_folder_files(folder_id: str, service: Union[Resource, None] = None):
+    """List all the files in a folder, `PAGE_SIZE` at a time.
+
+    Parameters
+    ----------
+    - folder_id `str`: The id of the folder.
+    - service `Resource | None`: The service to use, that of the
+        calling thread if not given.
+
+    Returns
+    -------
+    - list[BaseFile]: The files in the folder.
+    - dict: The number of files and pages listed, the time taken, and
+        the error if the listing stopped early.
+    """
+    start = perf_counter()
+    if service is None:
+        service = make_connection()
+    files: list[BaseFile] = []
+    page_count, error_message = 0, None
+    try:
+        page_token = None
+        while True:
+            # Search for all files with the folder as parent.
+            response = service.files().list(
+                q=f"'{folder_id}' in parents and trashed = false",
+                spaces='drive',
+                fields='nextPageToken, files(id, name, mimeType)',
+                pageSize=PAGE_SIZE,
+                pageToken=page_token
+            ).execute()
+            page_count += 1
+            files.extend(response.get("files", []))
+            page_token = response.get("nextPageToken", None)
+
+            if page_token is None:
+                break
+
+    except HttpError as error:
+        logger_monitor.exception(f"An error occurred: {error}")
+        error_message = str(error)
+
+    return files, {
+        "file_count": len(files),
+        "page_count": page_count,
+        "list_time": round(perf_counter() - start, 4),
+        "error": error_message
+    }
+
+def classify_file(file: BaseFile, folder_id: str, codes: frozenset[str],
+        writer: Union[BulkWriter, None] = None,
+        snapshot: Union[ScanSnapshot, None] = None):
+    """Store a file in drive as a classified or an exempted document.
+
+    Parameters
+    ----------
+    - file `BaseFile`: The file as listed by drive.
+    - folder_id `str`: The id of the folder the file is in.
+    - codes `frozenset[str]`: The valid codes.
+    - writer `BulkWriter | None`: Buffer the write in this writer.
+    - snapshot `ScanSnapshot | None`: Skip the write if the file is
+        stored as it is in this snapshot.
+
+    Returns
+    -------
+    - str | None: `"file"` or `"exempt"` depending on where the file
+        was stored, None if the file is not to be tracked.
+    """
+    name = file.get("name")
+    if name is None or name.lower().startswith("read"):
+        return None
+    year, code = file_details_from_name(name, codes)
+    file["parent"] = folder_id
+    kind = "exempt"
+    if year is not None and code is not None:
+        file["year"] = year
+        file["code"] = code
+        kind = "file"
+    if snapshot is not None:
+        outcome, stale = snapshot.compare(kind, file)
+        if outcome == "unchanged":
+            return kind
+        # A rename can move the file between the collections.
+        if "file" in stale:
+            remove_file_document(file["id"], writer)
+        if "exempt" in stale:
+            remove_exempt_document(file["id"], writer)
+    if kind == "file":
+        create_file_document(file, writer)
+    else:
+        create_exempt_document(file, writer)
+    return kind
+
+def fetch_start_page_token(service: Resource) -> Union[str, None]:
+    """Get the token from which future changes in drive are listed."""
+    try:
+        response = service.changes().getStartPageToken().execute()
+    except HttpError as error:
+        logger_monitor.exception(f"An error occurred: {error}")
+        return None
+    return response.get("startPageToken")
+
+def sync_drive_changes(on_progress: Union[Callable[[dict], None], None] = None):
+    """Update the data with only the changes made in drive since the
+    last scan or sync.
+
+    Falls back to a full scan with `scan_drive` when there is no saved
+    page token, or when drive no longer accepts the saved one.
+
+    Parameters
+    ----------
+    - on_progress `Callable[[dict], None] | None`: Called with the
+        changes processed so far, after each page of changes.
+
+    Returns
+    -------
+    - dict[str, int]: The count of changes the program has applied.
+    """
+    state = fetch_meta_document("drive_changes")
+    if state is None or state.get("page_token") is None:
+        return scan_drive(on_progress=on_progress)
+
+    service = make_connection()
+    codes = reload_code_index().codes
+    folder_ids = {folder["_id"] for folder in fetch_all_folders()}
+    writer = BulkWriter()
+
+    change_count, file_count, exempt_count, removed_count = 0, 0, 0, 0
+    page_token = state.get("page_token")
+    try:
+        while page_token is not None:
+            response = service.changes().list(
+                pageToken=page_token,
+                spaces="drive",
+                includeRemoved=True,
+                fields=(
+                    "nextPageToken, newStartPageToken, changes(fileId, "
+                    "removed, file(id, name, mimeType, parents, trashed))"
+                )
+            ).execute()
+            scan_pages.inc("sync")
+
+            changes = response.get("changes", [])
+            # Only the files stored are removed, the changes to the rest
+            # of the drive are left alone.
+            stored = fetch_stored_ids([change["fileId"] for change in changes])
+
+            def remove_stored(file_id: str, keep: Union[str, None] = None):
+                """Remove the file from the collections it is stored in
+                other than `keep`, and whether it was in any."""
+                removed = False
+                if keep != "file" and file_id in stored["file"]:
+                    remove_file_document(file_id, writer)
+                    stored["file"].discard(file_id)
+                    removed = True
+                if keep != "exempt" and file_id in stored["exempt"]:
+                    remove_exempt_document(file_id, writer)
+                    stored["exempt"].discard(file_id)
+                    removed = True
+                return removed
+
+            for change in changes:
+                change_count += 1
+                file = change.get("file") or {}
+                parents = [
+                    parent for parent in file.get("parents", [])
+                    if parent in folder_ids
+                ]
+                if file.get("mimeType") == FOLDER_MIME_TYPE:
+                    # Only a rename of a tracked folder matters.
+                    if change["fileId"] in folder_ids and not file.get("trashed"):
+                        create_folder_document({
+                            "id": file["id"],
+                            "name": file["name"],
+                            "mimeType": file["mimeType"]
+                        })
+                    continue
+
+                if change.get("removed") or file.get("trashed") or not parents:
+                    # Deleted, trashed or moved out of the tracked folders.
+                    if remove_stored(change["fileId"]):
+                        removed_count += 1
+                    continue
+
+                kind = classify_file({
+                    "id": file["id"],
+                    "name": file.get("name"),
+                    "mimeType": file.get("mimeType")
+                }, parents[0], codes, writer)
+                if kind is not None:
+                    scan_files.inc("sync", kind)
+                    stored[kind].add(change["fileId"])
+                # A rename can move the file between the collections.
+                if remove_stored(change["fileId"], kind) and kind is None:
+                    removed_count += 1
+                if kind == "file":
+                    file_count += 1
+                elif kind == "exempt":
+                    exempt_count += 1
+
+            # Save after every page so an interrupted sync can resume.
+            writer.flush()
+            page_token = response.get("nextPageToken")
+            update_meta_document("drive_changes", {
+                "page_token": page_token or response.get("newStartPageToken")
+            })
+            if on_progress is not None:
+                on_progress({"files_processed": change_count})
+
+    except HttpError as error:
+        if error.resp.status in (400, 404, 410):
+            # The saved page token is no longer valid, rescan everything.
+            logger_monitor.warning(f"Page token rejected, rescanning: {error}")
+            return scan_drive(on_progress=on_progress)
+        logger_monitor.exception(f"An error occurred: {error}")
 
     return {
-        "folder_count": folder_count,
+        "mode": "incremental",
+        "change_count": change_count,
         "file_count": file_count,
         "exempt_count": exempt_count,
-        "total_count": total_count
+        "removed_count": removed_count,
+        **writer.summary()
     }
 
-def file_details_from_name(name: str, code_list: CodeList):
+def file_details_from_name(name: str, codes: frozenset[str]):
     try:
         date, code, _ = name.split("_", 2)
         code = code.upper()
-        if code not in code_list:
+        if code not in codes:
             raise KeyError
     except ValueError:
         return None, None
@@ -238,29 +652,102 @@ def file_details_from_name(name: str, code_list: CodeList):
         else:
             return year, code
 
-async def upload_file_to_drive(file: UploadFile):
+async def upload_file_to_drive(file: UploadFile,
+        upload_id: Union[str, None] = None):
     """Upload a file to drive
 
+    The file is streamed from its spooled temporary file to drive in
+    chunks of `UPLOAD_CHUNK_SIZE`, so the whole file is never held in
+    memory. The progress is saved in `uploads_data` after every chunk.
+
     Parameters
     -----------
     - file (fastapi.UploadFile): The file that needs to be
     uploaded to drive.
+    - upload_id (str | None): The id of an interrupted upload of the
+    same file, to resume it from the last chunk drive received.
     """
+    return await run_in_threadpool(stream_file_to_drive, file, upload_id)
+
+def stream_file_to_drive(file: UploadFile, upload_id: Union[str, None] = None):
+    """Upload a file to drive chunk by chunk, see `upload_file_to_drive`."""
+    upload = None
+    if upload_id is not None:
+        upload = fetch_upload_document(upload_id)
+        if (upload is None or upload.get("status") == "done"
+                or upload.get("name") != file.filename):
+            return {"error": "There is no interrupted upload of this file",
+                    "upload_id": upload_id}
+    else:
+        upload_id = uuid4().hex
+
     service = make_connection()
+    request = None
     try:
         file_metadata = {
             "name": file.filename,
-            "parents": ["1jdXUkSPl06axEnaTQryyQuMx9tZlGghX"] # Events folder
+            "parents": [UPLOAD_FOLDER_ID]
         }
         media = MediaIoBaseUpload(
-            BytesIO(await file.read()), mimetype=file.content_type,
-            chunksize=1024*1024, resumable=True
+            file.file, mimetype=file.content_type,
+            chunksize=UPLOAD_CHUNK_SIZE, resumable=True
         )
-        file = service.files().create(
+        request = service.files().create(
             body=file_metadata,
             media_body=media,
-            fields="id"
-        ).execute()
-        return {"file_id": file.get("id")}
-    except HttpError as error:
-        return {"error": f"File could not be uploaded {error}"}
+            fields="id, name, mimeType"
+        )
+        if upload is not None and upload.get("resumable_uri") is not None:
+            # Continue the session drive already has for this file.
+            request.resumable_uri = upload["resumable_uri"]
+            request.resumable_progress = upload.get("progress", 0)
+        update_upload_document(upload_id, {
+            "name": file.filename,
+            "mime_type": file.content_type,
+            "size": media.size(),
+            "progress": request.resumable_progress,
+            "status": "uploading"
+        })
+
+        response = None
+        while response is None:
+            status, response = request.next_chunk()
+            update_upload_document(upload_id, {
+                "resumable_uri": request.resumable_uri,
+                "progress": media.size() if response else request.resumable_progress
+            })
+
+        update_upload_document(upload_id, {
+            "status": "done",
+            "file_id": response.get("id")
+        })
+        # Record the file right away instead of waiting for a refresh.
+        classify_file(dict(response), UPLOAD_FOLDER_ID,
+                      reload_code_index().codes)
+        return {"file_id": response.get("id"), "upload_id": upload_id}
+    except (HttpError, OSError, httplib2.HttpLib2Error) as error:
+        # Drive refusing a chunk, or the connection timing out or being
+        # reset, leaves the session to be resumed from the last chunk
+        # drive received.
+        logger_monitor.exception(f"Upload {upload_id} interrupted: {error}")
+        interrupted = {"status": "interrupted"}
+        if request is not None:
+            interrupted["progress"] = request.resumable_progress
+        update_upload_document(upload_id, interrupted)
+        return {"error": f"File could not be uploaded {error}",
+                "upload_id": upload_id}
+
+def upload_progress(upload_id: str) -> Union[dict, None]:
+    """Get how much of an upload drive has received.
+
+    Returns
+    -------
+    - dict | None: The name, size, bytes received and status of the
+        upload, None if there is no such upload.
+    """
+    upload = fetch_upload_document(upload_id)
+    if upload is None:
+        return None
+    upload.pop("resumable_uri", None)
+    upload["upload_id"] = upload.pop("_id")
+    return upload
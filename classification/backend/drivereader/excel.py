@@ -1,5 +1,7 @@
 import logging
+from hashlib import sha256
 from json import dumps, dump
+from os import path
 from os import system as ossystem
 from sys import exit as sysexit
 from typing import Union
@@ -16,12 +18,23 @@ from drivereader._type import (
     Code,
     Name
 )
-from drivereader.database import code_insert
+from drivereader.codes import (
+    CODE_LIST_FILE,
+    CodeIndex,
+    reload_code_index,
+    swap_code_index
+)
+from drivereader.database import (
+    code_insert_many,
+    fetch_meta_document,
+    rebuild_naac_counts,
+    update_meta_document
+)
 
 # Using the logs.
 logger_monitor = logging.getLogger(__name__)
 logger_monitor.setLevel(logging.ERROR)
-handler = logging.FileHandler("drive_reader_logs.log")
+handler = logging.FileHandler("drive_reader_logs.log", delay=True)
 handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
 logger_monitor.addHandler(handler)
 
@@ -33,16 +46,39 @@ class ExcelWorker():
         self.read_classification_exl()
 
     def read_classification_exl(self):
-        """Read the classification categories."""
-        # Load the workbook, if not exit the program.
+        """Read the classification categories.
+
+        The workbook is only read if it has changed since it was last
+        read, going by the hash saved in `meta_data`. Otherwise the
+        codes are taken from the code index.
+        """
+        # Hash the workbook, if not exit the program.
         try:
-            self.doc_wb:Workbook = load_workbook("data/doc_classification.xlsx")
+            with open("data/doc_classification.xlsx", "rb") as workbook:
+                self.sheet_hash = sha256(workbook.read()).hexdigest()
             logger_monitor.debug("Classification file found.")
         except FileNotFoundError:
             print("Classification file not found.")
             logger_monitor.warning("Classification file not found.")
             sysexit()
 
+        state = fetch_meta_document("classification_sheet") or {}
+        self.changed = state.get("hash") != self.sheet_hash
+        index = reload_code_index()
+        if not self.changed and len(index) != 0:
+            self.code_list = {
+                code: [name, category, list(classifications)]
+                for code, (name, category, classifications)
+                in index.code_list.items()
+            }
+            logger_monitor.debug("Classification file unchanged.")
+            return
+        self.changed = True
+
+        # Stream the rows instead of loading the whole workbook.
+        self.doc_wb:Workbook = load_workbook("data/doc_classification.xlsx",
+                                            read_only=True)
+
         # * The following are the data to be extracted from the excel sheet.
         # Category - The name of major types of requirements.
         # Classification - The numeric code.
@@ -83,7 +119,7 @@ class ExcelWorker():
             #             self.code_list[code] = [name, ws.title, ["Unknown"]]
 
         #Write the generated data to files for evaluation.
-        with open("data/code_list.json", "w") as file:
+        with open(CODE_LIST_FILE, "w") as file:
             code_obj = dumps(self.code_list, indent=4)
             file.write(code_obj)
         with open("data/classification_list.json", "w") as file:
@@ -96,9 +132,15 @@ class ExcelWorker():
         logger_monitor.debug(self.code_list)
         logger_monitor.debug(self.classification_list)
 
+        self.doc_wb.close()
+
+        # Use the new codes without a restart.
+        swap_code_index(CodeIndex(self.code_list, path.getmtime(CODE_LIST_FILE)))
         # Write the codes to database.
-        for code, val in self.code_list.items():
-            code_insert(code, val)
+        code_insert_many(self.code_list)
+        # The classifications of the codes may have changed.
+        rebuild_naac_counts()
+        update_meta_document("classification_sheet", {"hash": self.sheet_hash})
 
     # def write_data_to_excel(self,
     #         drive_data: dict[Category, dict[Year, dict[Code, int]]],
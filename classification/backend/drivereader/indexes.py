@@ -0,0 +1,177 @@
+"""The indexes of the NAAC collections, and checks that the queries use
+them."""
+import logging
+from typing import Iterator
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+
+from drivereader.database import (
+    FILES_SORT,
+    NAAC_COUNT_GROUP,
+    NAAC_COUNT_SORT,
+    database,
+    files_data,
+    files_query,
+    meta_data,
+    naac_count_query,
+    naac_counts
+)
+
+# Using the logs.
+logger_monitor = logging.getLogger(__name__)
+logger_monitor.setLevel(logging.ERROR)
+handler = logging.FileHandler("drive_reader_logs.log", delay=True)
+handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
+logger_monitor.addHandler(handler)
+
+# The indexes each collection should have, by collection. The other
+# indexes of these collections, left by older versions, are dropped.
+INDEXES: dict[Collection, list[IndexModel]] = {
+    files_data: [
+        # Files of a year, optionally of a code.
+        IndexModel([("year", ASCENDING), ("code", ASCENDING)], name="year_code"),
+        # Files of a code across the years, in the order of the cursor.
+        IndexModel(
+            [("code", ASCENDING), ("year", ASCENDING), ("_id", ASCENDING)],
+            name="code_year_id"
+        ),
+        # Files of a range of years, in the order of the cursor.
+        IndexModel([("year", ASCENDING), ("_id", ASCENDING)], name="year_id"),
+    ],
+    naac_counts: [
+        # Classification rows of a range of years, and the valid years.
+        IndexModel(
+            [("year", ASCENDING), ("classification", ASCENDING)],
+            name="year_classification"
+        ),
+        IndexModel([("year", ASCENDING), ("code", ASCENDING)], name="year_code"),
+    ],
+}
+
+
+def ensure_indexes() -> dict[str, list[str]]:
+    """Create the indexes in `INDEXES`, and drop those no longer in it.
+
+    Creating an index that already exists does nothing, so this is
+    safe to call on every startup.
+
+    Returns
+    -------
+    - dict[str, list[str]]: The names of the indexes of each collection.
+    """
+    created = {}
+    for collection, indexes in INDEXES.items():
+        declared = {index.document["name"] for index in indexes}
+        try:
+            created[collection.name] = collection.create_indexes(indexes)
+            for name in collection.index_information():
+                if name != "_id_" and name not in declared:
+                    collection.drop_index(name)
+        except OperationFailure as error:
+            logger_monitor.exception(
+                f"Indexes of {collection.name} could not be created: {error}"
+            )
+    return created
+
+def query_shapes(year: int, code: str, codes: tuple[str, ...]
+        ) -> list[tuple[str, Collection, dict]]:
+    """The queries the api runs, with sample values.
+
+    Returns
+    -------
+    - list[tuple[str, Collection, dict]]: The name of the function, the
+        collection it reads and the arguments of the `find` or
+        `aggregate` it runs. `reads_all` marks a query that is meant to
+        read the whole collection.
+    """
+    return [
+        ("fetch_naac_count", naac_counts, {
+            "filter": naac_count_query(year, year),
+            "sort": NAAC_COUNT_SORT
+        }),
+        ("fetch_all_files", files_data, {
+            "filter": files_query(None, year - 1, year),
+            "sort": FILES_SORT
+        }),
+        ("fetch_all_files", files_data, {
+            "filter": files_query(code, year - 1, year, (year, "")),
+            "sort": FILES_SORT
+        }),
+        ("read_classification_files", files_data, {
+            "filter": files_query(list(codes), year - 1, year),
+            "sort": FILES_SORT
+        }),
+        ("get_valid_years", meta_data, {
+            "filter": {"_id": "year_bounds"}
+        }),
+        ("refresh_valid_years", naac_counts, {
+            "filter": {"code": {"$exists": True}},
+            "sort": [("year", ASCENDING)],
+            "limit": 1
+        }),
+        # Counts every file, when the rollup is built or checked.
+        ("compute_naac_counts", files_data, {
+            "pipeline": [NAAC_COUNT_GROUP],
+            "reads_all": True
+        }),
+    ]
+
+def plan_stages(plan) -> Iterator[str]:
+    """Walk through the stages of the winning plans in an explain."""
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key == "stage":
+                yield value
+            elif key != "rejectedPlans":
+                yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
+
+def explain_queries(year: int = 2023, code: str = "RPIF",
+        codes: tuple[str, ...] = ("EMPL", "ENTR", "SKDT")) -> list[dict]:
+    """Explain each query the api runs and flag collection scans.
+
+    Parameters
+    ----------
+    - year `int`: The year to use in the queries.
+    - code `str`: The code to use in the queries.
+    - codes `tuple[str, ...]`: The codes of a classification to use in the
+        queries.
+
+    Returns
+    -------
+    - list[dict]: The stages of each query, whether it scans the
+        whole collection, and whether it is meant to.
+    """
+    report = []
+    for name, collection, query in query_shapes(year, code, codes):
+        if "pipeline" in query:
+            explain = database.command(
+                "explain",
+                {
+                    "aggregate": collection.name,
+                    "pipeline": query["pipeline"],
+                    "cursor": {}
+                },
+                verbosity="queryPlanner"
+            )
+        else:
+            cursor = collection.find(query["filter"])
+            if "sort" in query:
+                cursor = cursor.sort(query["sort"])
+            if "limit" in query:
+                cursor = cursor.limit(query["limit"])
+            explain = cursor.explain()
+        stages = list(plan_stages(explain.get("queryPlanner", explain)))
+        report.append({
+            "function": name,
+            "collection": collection.name,
+            "query": query.get("filter", query.get("pipeline")),
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages,
+            "reads_all": query.get("reads_all", False)
+        })
+    return report
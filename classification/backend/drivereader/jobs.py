@@ -0,0 +1,157 @@
+"""Drive refreshes run in the background, one at a time."""
+import logging
+import threading
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Union
+from uuid import uuid4
+
+from drivereader.database import (
+    acquire_lock,
+    create_job_document,
+    fail_job_document,
+    fetch_job_document,
+    fetch_lock,
+    release_lock,
+    remove_job_document,
+    renew_lock,
+    update_job_document
+)
+
+# The lock held by the running refresh, in `meta_data`.
+REFRESH_LOCK = "refresh_lock"
+# A refresh that has not reported progress for this long is taken to
+# have stopped, and its lock is given up.
+LOCK_TTL = timedelta(minutes=10)
+# The error of a job whose worker stopped before it finished.
+STOPPED_ERROR = "The refresh stopped before it finished."
+
+# Using the logs.
+logger_monitor = logging.getLogger(__name__)
+logger_monitor.setLevel(logging.ERROR)
+handler = logging.FileHandler("drive_reader_logs.log", delay=True)
+handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
+logger_monitor.addHandler(handler)
+
+
+def start_refresh_job(full: bool = False, parallel: bool = True) -> dict:
+    """Start a refresh of the drive data in the background.
+
+    Only one refresh runs at a time across all the workers. If one is
+    already running, its job is returned instead of starting another.
+
+    Parameters
+    ----------
+    - full `bool`: Whether to rescan all documents in the drive.
+    - parallel `bool`: Whether to list the folders at the same time.
+
+    Returns
+    -------
+    - dict: The job id, its status, and whether it was already running.
+    """
+    job_id = uuid4().hex
+    # The job exists before the lock is taken, so anyone who finds the
+    # lock can find the job.
+    create_job_document(job_id, {
+        "mode": "full" if full else "incremental",
+        "status": "queued",
+        "created_at": datetime.utcnow(),
+        "progress": {}
+    })
+    owner = None
+    while owner is None:
+        # Nobody holds the lock when its owner released it between the
+        # attempt to take it and the read of who holds it.
+        owner = acquire_lock(REFRESH_LOCK, job_id, LOCK_TTL)
+    if owner != job_id:
+        remove_job_document(job_id)
+        running = fetch_job_document(owner) if owner is not None else None
+        return {
+            "job_id": owner,
+            "status": running.get("status") if running else None,
+            "attached": True
+        }
+
+    threading.Thread(
+        target=run_refresh_job,
+        args=(job_id, full, parallel),
+        name=f"refresh-{job_id}",
+        daemon=True
+    ).start()
+    return {"job_id": job_id, "status": "queued", "attached": False}
+
+def run_refresh_job(job_id: str, full: bool, parallel: bool):
+    """Refresh the drive data and record the progress in the job."""
+    # The drive client is only loaded by the workers that refresh.
+    from drivereader.drive import scan_drive, sync_drive_changes
+
+    start = monotonic()
+    update_job_document(job_id, {
+        "status": "running",
+        "started_at": datetime.utcnow()
+    })
+
+    def on_progress(progress: dict):
+        elapsed = monotonic() - start
+        update_job_document(job_id, {
+            **{f"progress.{key}": value for key, value in progress.items()},
+            "progress.rate": round(progress.get("files_processed", 0)
+                                   / max(elapsed, 1e-6), 1),
+            "progress.elapsed": round(elapsed, 1)
+        })
+        renew_lock(REFRESH_LOCK, job_id, LOCK_TTL)
+
+    try:
+        if full:
+            result = scan_drive(parallel, on_progress)
+        else:
+            result = sync_drive_changes(on_progress)
+    except Exception as error:
+        logger_monitor.exception(f"Refresh {job_id} failed: {error}")
+        update_job_document(job_id, {
+            "status": "failed",
+            "error": str(error),
+            "finished_at": datetime.utcnow()
+        })
+    else:
+        update_job_document(job_id, {
+            "status": "done" if result is not None else "failed",
+            "result": result,
+            "error": None if result is not None else "The drive could not be scanned.",
+            "finished_at": datetime.utcnow()
+        })
+    finally:
+        release_lock(REFRESH_LOCK, job_id)
+
+def job_stopped(job: dict, lock: Union[dict, None]) -> bool:
+    """Whether the worker of a job that has not finished has stopped.
+
+    A running job holds the refresh lock until it is done or has
+    failed, so the job stopped if the lock was released, taken by
+    another job, or not renewed in time.
+
+    Parameters
+    ----------
+    - job `dict`: The job document.
+    - lock `dict | None`: The refresh lock document.
+    """
+    if job["status"] in ("done", "failed"):
+        return False
+    holds_lock = lock is not None and lock.get("owner") == job["_id"]
+    if holds_lock:
+        return lock["expires_at"] < datetime.utcnow()
+    # A queued job may not have taken the lock yet.
+    return job["status"] == "running"
+
+def refresh_job_status(job_id: str) -> Union[dict, None]:
+    """The status, progress and result of a refresh job.
+
+    A job whose worker stopped is marked as failed.
+    """
+    job = fetch_job_document(job_id)
+    if job is not None and job_stopped(job, fetch_lock(REFRESH_LOCK)):
+        fail_job_document(job_id, STOPPED_ERROR)
+        job = fetch_job_document(job_id)
+    if job is not None:
+        job["job_id"] = job.pop("_id")
+    return job
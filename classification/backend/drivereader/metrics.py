@@ -0,0 +1,132 @@
+"""The metrics of each worker, written out in the Prometheus text format.
+
+Each worker counts its own requests, database commands, drive calls
+and scans; Prometheus adds them up across the workers it scrapes.
+
+The database commands and drive calls are timed by the listeners of
+`drivereader.database` and `drivereader.client`, so that the metrics
+can be served without loading pymongo or googleapiclient.
+"""
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+# The upper bounds in seconds of the buckets of the latency histograms.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COMMAND_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 5)
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...],
+        extra: str = "") -> str:
+    labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter():
+    """A count that only goes up, by the values of its labels."""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()
+            ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram():
+    """The count and sum of observations, and how many fell in each
+    bucket, by the values of its labels."""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # The count in each bucket, with the last for above all bounds,
+        # and the sum of each set of labels.
+        self.values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self.lock:
+            counts, total = self.values.setdefault(
+                labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    bucket = format_labels(self.labels, labels, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+                label_text = format_labels(self.labels, labels)
+                lines.append(f"{self.name}_sum{label_text} {total[0]}")
+                lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "The time taken to answer a request, by route.",
+    ("method", "route", "status")
+)
+mongodb_command_duration = Histogram(
+    "mongodb_command_duration_seconds",
+    "The time taken by a database command, by collection and command.",
+    ("collection", "command", "outcome"),
+    COMMAND_BUCKETS
+)
+drive_request_duration = Histogram(
+    "drive_api_request_duration_seconds",
+    "The time taken by a drive api call, by method.",
+    ("method", "status")
+)
+scan_files = Counter(
+    "scan_files_total",
+    "The files stored by scans and syncs, by mode and kind.",
+    ("mode", "kind")
+)
+scan_pages = Counter(
+    "scan_pages_total",
+    "The pages of files or changes listed by scans and syncs, by mode.",
+    ("mode",)
+)
+METRICS = (http_request_duration, mongodb_command_duration,
+           drive_request_duration, scan_files, scan_pages)
+
+
+def render_metrics() -> str:
+    """All the metrics in the Prometheus text format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def observe_drive_request(method: str, start: float, status: str = "ok"):
+    """Record a drive call not made through `TimedHttpRequest` of
+    `drivereader.client`, like a batch request."""
+    drive_request_duration.observe(perf_counter() - start, method, status)
@@ -0,0 +1,156 @@
+"""Profile single requests on demand, for admins.
+
+A request is profiled when it carries the `PROFILE_TOKEN` in the
+`X-Profile-Token` header or the `profile_token` query parameter. It is
+run under cProfile while a thread samples the stack of the worker
+thread, and both are saved to `PROFILE_DIR`:
+
+- `<id>.pstats`, to read with `pstats` or snakeviz
+- `<id>.collapsed`, the sampled stacks in the collapsed format of
+  flamegraph.pl and speedscope
+- `<id>.json`, the request and how long it took
+
+Only the last `PROFILE_LIMIT` profiles are kept. Without a token set,
+no profiling code runs at all.
+
+The profilers follow the worker thread, so a request answered by a
+`def` endpoint in the threadpool is only seen up to the hand off, and
+other requests the worker serves at the same time show up too.
+"""
+import cProfile
+import hmac
+import os
+import sys
+import threading
+from datetime import datetime
+from json import dump, load
+from time import perf_counter
+from typing import Union
+from uuid import uuid4
+
+# The token that turns on profiling for a request, unset to turn it off.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# The most profiles kept on disk.
+PROFILE_LIMIT = int(os.getenv("PROFILE_LIMIT", 50))
+# The seconds between two samples of the stack.
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.001))
+PROFILE_FILES = {
+    "pstats": "application/octet-stream",
+    "collapsed": "text/plain",
+}
+
+
+def is_admin(token: Union[str, None]) -> bool:
+    """Whether the token is the profile token."""
+    return (PROFILE_TOKEN is not None and token is not None
+            and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()))
+
+
+class StackSampler():
+    """Count the stacks of a thread, sampled every `interval` seconds."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL
+            ) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: dict[str, int] = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} "
+                             f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+class RequestProfile():
+    """Profile what runs on the current thread until the block ends."""
+
+    def __enter__(self):
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident()).__enter__()
+        self.start = perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.duration = perf_counter() - self.start
+        self.sampler.__exit__(*exc_info)
+
+    def save(self, details: dict) -> str:
+        """Save the profile and drop the oldest beyond `PROFILE_LIMIT`.
+
+        Returns
+        -------
+        - str: The id of the profile.
+        """
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        created_at = datetime.utcnow()
+        profile_id = f"{created_at:%Y%m%dT%H%M%S%f}-{uuid4().hex[:8]}"
+        base = os.path.join(PROFILE_DIR, profile_id)
+        self.profile.dump_stats(f"{base}.pstats")
+        with open(f"{base}.collapsed", "w") as file:
+            for stack, count in sorted(self.sampler.stacks.items()):
+                file.write(f"{stack} {count}\n")
+        with open(f"{base}.json", "w") as file:
+            dump({
+                "id": profile_id,
+                "created_at": created_at.isoformat(),
+                "duration": round(self.duration, 6),
+                "samples": sum(self.sampler.stacks.values()),
+                **details
+            }, file)
+        for old_id in list_profile_ids()[PROFILE_LIMIT:]:
+            for extension in ("json", *PROFILE_FILES):
+                try:
+                    os.remove(os.path.join(PROFILE_DIR, f"{old_id}.{extension}"))
+                except FileNotFoundError:
+                    pass
+        return profile_id
+
+
+def list_profile_ids() -> list[str]:
+    """The ids of the profiles on disk, newest first."""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted((name[:-len(".json")] for name in names
+                   if name.endswith(".json")), reverse=True)
+
+def list_profiles() -> list[dict]:
+    """The requests profiled, newest first."""
+    profiles = []
+    for profile_id in list_profile_ids():
+        try:
+            with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as file:
+                profiles.append(load(file))
+        except FileNotFoundError:
+            # Dropped by another worker meanwhile.
+            continue
+    return profiles
+
+def profile_path(profile_id: str, kind: str) -> Union[str, None]:
+    """The file of a profile, None if there is no such profile."""
+    if kind not in PROFILE_FILES or profile_id not in list_profile_ids():
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{kind}")
+    return path if os.path.exists(path) else None
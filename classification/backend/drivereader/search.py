@@ -0,0 +1,276 @@
+"""An in-memory index of the names of the classified and exempted files
+of each worker, for finding a file by a fragment of its name."""
+import asyncio
+import heapq
+import os
+import re
+from itertools import islice
+from time import monotonic, perf_counter
+from typing import Union
+
+from drivereader.async_database import STREAM_BATCH_SIZE, find_names
+from drivereader.cache import result_cache
+
+# The fewest seconds between two reads of the names, so that a scan
+# changing the data many times does not keep the index busy.
+SEARCH_REFRESH_INTERVAL = float(os.getenv("SEARCH_REFRESH_INTERVAL", 5))
+
+WORD = re.compile(r"[a-z0-9]+")
+# The score of a term that is a word of the name, that starts one, and
+# that is inside one.
+WORD_SCORE, PREFIX_SCORE, SUBSTRING_SCORE = 3, 2, 1
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def short_prefixes(word: str) -> set[str]:
+    return {word[:1], word[:2]}
+
+
+class SearchIndex():
+    """The words of the file names, with the files they are found in.
+
+    A query is split into words the same way as the names, so each term
+    can only be found inside one word of a name. The words a term is
+    found in are looked up in the trigrams of the words, or in their
+    first one or two letters for a term shorter than three letters, and
+    the files are then found, filtered and ranked with set operations.
+
+    The index is brought up to date when the data generation has gone
+    up: all the names are read again, but only the files added, changed
+    or removed since the last read are indexed again. The changes are
+    gathered while the names are read and applied at once after, so
+    searches are answered from the old index until then, and
+    `generation` is always the one the index was made at.
+    """
+
+    def __init__(self, refresh_interval: float = SEARCH_REFRESH_INTERVAL
+            ) -> None:
+        self.refresh_interval = refresh_interval
+        # The kind, name, words, year and code of each file, by id.
+        self.documents: dict[str, tuple] = {}
+        # The order of the files with the same score, by id.
+        self.order: dict[str, tuple] = {}
+        # All the ids in that order, made again when files change.
+        self.ranked: Union[list[str], None] = None
+        self.files_by_word: dict[str, set[str]] = {}
+        self.words_by_gram: dict[str, set[str]] = {}
+        self.words_by_prefix: dict[str, set[str]] = {}
+        self.files_by_year: dict[int, set[str]] = {}
+        self.files_by_code: dict[str, set[str]] = {}
+        self.generation: Union[int, None] = None
+        self.refreshed_at = float("-inf")
+        self.refresh_time = 0.0
+        self.task: Union[asyncio.Task, None] = None
+
+    async def ready(self) -> "SearchIndex":
+        """Start bringing the index up to date if the data has changed.
+
+        Only the first call waits for the index to be made.
+        """
+        generation = await result_cache.current_generation()
+        if (generation != self.generation
+                and (self.task is None or self.task.done())
+                and monotonic() - self.refreshed_at >= self.refresh_interval):
+            self.refreshed_at = monotonic()
+            self.task = asyncio.create_task(self.refresh(generation))
+        if self.generation is None:
+            await asyncio.shield(self.task)
+        return self
+
+    async def refresh(self, generation: int):
+        """Read all the names and index the files that have changed."""
+        start = perf_counter()
+        seen = set()
+        changed = []
+        for kind, cursor in find_names().items():
+            async for document in cursor:
+                file_id = document["_id"]
+                seen.add(file_id)
+                entry = (kind, document.get("name") or "",
+                         document.get("year"), document.get("code"))
+                current = self.documents.get(file_id)
+                if current is None or (current[0], current[1],
+                        current[3], current[4]) != entry:
+                    changed.append((file_id, entry))
+                if len(seen) % STREAM_BATCH_SIZE == 0:
+                    # Let the requests waiting on the worker through.
+                    await asyncio.sleep(0)
+        # Nothing below awaits, so no search sees the index half changed.
+        for file_id in [file_id for file_id in self.documents
+                        if file_id not in seen]:
+            self.remove(file_id)
+        for file_id, entry in changed:
+            if file_id in self.documents:
+                self.remove(file_id)
+            self.add(file_id, *entry)
+        self.rank()
+        self.generation = generation
+        self.refresh_time = round(perf_counter() - start, 4)
+
+    def add(self, file_id: str, kind: str, name: str, year: Union[int, None],
+            code: Union[str, None]):
+        words = frozenset(WORD.findall(name.lower()))
+        self.documents[file_id] = (kind, name, words, year, code)
+        # Shorter names, then newer years, first.
+        self.order[file_id] = (len(name), -(year or 0), name)
+        self.ranked = None
+        for word in words:
+            if word not in self.files_by_word:
+                self.files_by_word[word] = set()
+                for gram in trigrams(word):
+                    self.words_by_gram.setdefault(gram, set()).add(word)
+                for prefix in short_prefixes(word):
+                    self.words_by_prefix.setdefault(prefix, set()).add(word)
+            self.files_by_word[word].add(file_id)
+        if kind == "file":
+            self.files_by_year.setdefault(year, set()).add(file_id)
+            self.files_by_code.setdefault(code, set()).add(file_id)
+
+    def remove(self, file_id: str):
+        kind, _, words, year, code = self.documents.pop(file_id)
+        del self.order[file_id]
+        self.ranked = None
+        for word in words:
+            self.files_by_word[word].discard(file_id)
+            if len(self.files_by_word[word]) != 0:
+                continue
+            del self.files_by_word[word]
+            for gram in trigrams(word):
+                discard(self.words_by_gram, gram, word)
+            for prefix in short_prefixes(word):
+                discard(self.words_by_prefix, prefix, word)
+        if kind == "file":
+            discard(self.files_by_year, year, file_id)
+            discard(self.files_by_code, code, file_id)
+
+    def rank(self) -> list[str]:
+        """All the ids in the order of the files with the same score."""
+        if self.ranked is None:
+            self.ranked = sorted(self.order, key=self.order.__getitem__)
+        return self.ranked
+
+    def best(self, files: set[str], count: int) -> list[str]:
+        """The first files in the order of the files with the same score."""
+        ranked = self.rank()
+        # Walking the ranked ids stops after about count / share of them,
+        # much quicker than keeping a heap of a large share of the files.
+        if count * len(ranked) < 10 * len(files) ** 2:
+            return list(islice(
+                (file_id for file_id in ranked if file_id in files), count))
+        return heapq.nsmallest(count, files, key=self.order.__getitem__)
+
+    def matching_words(self, term: str) -> set[str]:
+        """The words the term is in, or starts for a short term."""
+        if len(term) < 3:
+            return self.words_by_prefix.get(term, set())
+        postings = []
+        for gram in trigrams(term):
+            if gram not in self.words_by_gram:
+                return set()
+            postings.append(self.words_by_gram[gram])
+        postings.sort(key=len)
+        return {word for word in postings[0].intersection(*postings[1:])
+                if term in word}
+
+    def term_files(self, term: str) -> list[tuple[int, set[str]]]:
+        """The files of the term, split by the best score it gives them."""
+        words = self.matching_words(term)
+        exact = self.files_by_word.get(term, set())
+        prefixed = set().union(*(
+            self.files_by_word[word] for word in words
+            if word != term and word.startswith(term)
+        )) - exact
+        inside = set().union(*(
+            self.files_by_word[word] for word in words
+            if not word.startswith(term)
+        )) - exact - prefixed
+        return [
+            (WORD_SCORE, exact),
+            (PREFIX_SCORE, prefixed),
+            (SUBSTRING_SCORE, inside)
+        ]
+
+    def search(self, query: str, start_year: Union[int, None] = None,
+            end_year: Union[int, None] = None, code: Union[str, None] = None,
+            limit: int = 20) -> list[dict]:
+        """Find the files with every word of the query in their name.
+
+        A word of the name that is the term ranks above one that starts
+        with it, and that above one that only has it inside. Ties go to
+        the shorter name, then the newer year.
+
+        Parameters
+        ----------
+        - query `str`: The fragments of the name.
+        - start_year `int | None`: Only classified files from this year.
+        - end_year `int | None`: Only classified files up to this year.
+        - code `str | None`: Only classified files of this code.
+        - limit `int`: The most files to return.
+
+        Returns
+        -------
+        - list[dict]: The best matches, best first.
+        """
+        terms = list(dict.fromkeys(WORD.findall(query.lower())))
+        if len(terms) == 0:
+            return []
+        allowed = None
+        if start_year is not None:
+            allowed = set().union(*(
+                files for year, files in self.files_by_year.items()
+                if start_year <= year <= end_year
+            ))
+        if code is not None:
+            files = self.files_by_code.get(code, set())
+            allowed = files if allowed is None else allowed & files
+
+        # Split the matches into groups of the same score, one term at
+        # a time.
+        groups: list[tuple[int, set[str]]] = [(0, allowed)]
+        for term in terms:
+            tiers = self.term_files(term)
+            groups = [
+                (score + term_score,
+                 files if group is None else group & files)
+                for score, group in groups
+                for term_score, files in tiers
+            ]
+            groups = [(score, group) for score, group in groups
+                      if len(group) != 0]
+            if len(groups) == 0:
+                return []
+        scores: dict[int, set[str]] = {}
+        for score, group in groups:
+            scores.setdefault(score, set()).update(group)
+
+        results = []
+        for score in sorted(scores, reverse=True):
+            for file_id in self.best(scores[score], limit - len(results)):
+                kind, name, _, year, file_code = self.documents[file_id]
+                results.append({"id": file_id, "name": name, "kind": kind,
+                                "year": year, "code": file_code,
+                                "score": score})
+            if len(results) == limit:
+                break
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self.documents),
+            "words": len(self.files_by_word),
+            "generation": self.generation,
+            "refresh_time": self.refresh_time
+        }
+
+
+def discard(postings: dict, key, value):
+    """Take the value out of the postings of the key, and the key out if
+    it has no postings left."""
+    postings[key].discard(value)
+    if len(postings[key]) == 0:
+        del postings[key]
+
+
+search_index = SearchIndex()
@@ -0,0 +1,61 @@
+"""Start a worker quickly, and time how long it took.
+
+The modules that load pymongo, motor, googleapiclient and openpyxl are
+only imported when first used, or when the api warms up before taking
+requests. Each of those imports and each step of the warm up is timed,
+so that a slow start can be traced to what it spent the time on;
+`python -m benchmarks.startup` breaks the imports down by package.
+"""
+import importlib
+import sys
+from contextlib import contextmanager
+from time import perf_counter
+from types import ModuleType
+from typing import Union
+
+# The seconds taken by each step of the start of this worker and the
+# modules it loaded, in the order they ran.
+startup_steps: dict[str, dict[str, Union[float, int]]] = {}
+
+
+@contextmanager
+def startup_step(name: str):
+    """Time a step of the start of the worker."""
+    modules = len(sys.modules)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        startup_steps[name] = {
+            "seconds": round(perf_counter() - start, 4),
+            "modules": len(sys.modules) - modules
+        }
+
+
+class LazyModule():
+    """A module imported when one of its attributes is first used.
+
+    Parameters
+    ----------
+    - name `str`: The full name of the module, like
+        `"drivereader.drive"`.
+    """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module: Union[ModuleType, None] = None
+
+    def _load(self) -> ModuleType:
+        """Import the module if it has not been."""
+        if self._module is None:
+            module = sys.modules.get(self._name)
+            if module is None:
+                # The import lock makes the threads that need the module
+                # at the same time wait for the one importing it.
+                with startup_step(f"import {self._name}"):
+                    module = importlib.import_module(self._name)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
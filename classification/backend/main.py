@@ -1,7 +1,11 @@
 import asyncio
+import os
 import re
+import threading
+from contextlib import asynccontextmanager
 from datetime import date
-from json import load
+from hashlib import sha1
+from json import dumps
 from time import perf_counter
 from typing import Annotated, Union
 
@@ -12,28 +16,70 @@ from fastapi import (
     File,
     Form,
     Query,
+    Request,
+    Response,
     UploadFile
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from _type import CodeValues
-from drivereader.drive import scan_drive, upload_file_to_drive
-from drivereader.database import (
-    fetch_all_folders,
-    fetch_all_files,
-    fetch_naac_count,
-    get_valid_years
+from drivereader.codes import code_index
+from drivereader.metrics import http_request_duration, render_metrics
+from drivereader.profiling import (
+    PROFILE_FILES,
+    PROFILE_TOKEN,
+    RequestProfile,
+    is_admin,
+    list_profiles,
+    profile_path
 )
-from drivereader.excel import ExcelWorker
-
-time_now = perf_counter()
-app = FastAPI()
+from drivereader.startup import LazyModule, startup_step, startup_steps
+
+# Imported on first use or while warming up, see `drivereader.startup`.
+async_database = LazyModule("drivereader.async_database")
+cache = LazyModule("drivereader.cache")
+database = LazyModule("drivereader.database")
+drive = LazyModule("drivereader.drive")
+excel = LazyModule("drivereader.excel")
+indexes = LazyModule("drivereader.indexes")
+jobs = LazyModule("drivereader.jobs")
+search = LazyModule("drivereader.search")
+
+# Whether to load the drive client and the excel reader while warming
+# up, rather than on the first request that needs them.
+WARM_UP_DRIVE = os.getenv("WARM_UP_DRIVE", "false") == "true"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up the worker before it takes requests.
+
+    The database modules are imported, the indexes checked and the
+    `naac_counts` rollup built if it is missing, which connects to the
+    database. The steps are timed in `startup_steps`.
+    """
+    async_database._load()
+    cache._load()
+    search._load()
+    with startup_step("indexes"):
+        # Make sure the collections have the indexes the queries need.
+        indexes.ensure_indexes()
+    with startup_step("codes"):
+        code_index()
+    with startup_step("naac_counts"):
+        # The files stored before the rollup was kept are counted once.
+        database.ensure_naac_counts()
+    if WARM_UP_DRIVE:
+        jobs._load()
+        excel._load()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["https://localhost:3000"]
 
-with open("data/code_list.json", "r") as code_info:
-    CODE_LIST = load(code_info)
-
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -41,32 +87,138 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    """Time each request by the route it matched."""
+    start = perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    http_request_duration.observe(
+        perf_counter() - start,
+        request.method,
+        route.path if route is not None else "unmatched",
+        str(response.status_code)
+    )
+    return response
+
+# Only one request of the worker is profiled at a time.
+profile_lock = threading.Lock()
+
+class ProfileRequests():
+    """Profile the request if an admin asked for it, see
+    `drivereader.profiling`.
+
+    The requests without a profile token go straight through to the app,
+    without the task and stream of an `http` middleware.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        token = None
+        if scope["type"] == "http":
+            token = dict(scope["headers"]).get(b"x-profile-token")
+            if token is not None:
+                token = token.decode("latin-1")
+            elif b"profile_token=" in scope["query_string"]:
+                token = Request(scope).query_params.get("profile_token")
+        if token is None or not is_admin(token) \
+                or not profile_lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        profile = RequestProfile().__enter__()
+        profiling = True
+
+        async def send_profiled(message: Message):
+            nonlocal profiling
+            if message["type"] == "http.response.start":
+                # The profile ends when the response starts, as the body
+                # may be streamed for long after.
+                profile.__exit__(None, None, None)
+                profiling = False
+                profile_id = profile.save({
+                    "method": request.method,
+                    "path": request.url.path,
+                    "query": {key: value
+                              for key, value in request.query_params.items()
+                              if key != "profile_token"},
+                    "status": message["status"]
+                })
+                MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            if profiling:
+                profile.__exit__(None, None, None)
+            profile_lock.release()
+
+if PROFILE_TOKEN is not None:
+    # Without a token the requests do not go through the check at all.
+    app.add_middleware(ProfileRequests)
+
 @app.get("/api/naac", tags=["NAAC"])
-def get_naac_data(year: str=""):
+async def get_naac_data(request: Request, response: Response, year: str=""):
     """Get the naac related data.
 
     Returns
     ------
     - JSON: The data that needs to be shown in the site.
     """
-    start_year, end_year = select_years(year)
-    return fetch_naac_count(start_year, end_year)
+    not_modified = await check_etag(request, response)
+    if not_modified is not None:
+        return not_modified
+    start_year, end_year = await select_years(year)
+    return await cache.result_cache.get(
+        ("fetch_naac_count", start_year, end_year),
+        lambda: async_database.fetch_naac_count(start_year, end_year)
+    )
 
 @app.post("/api/upload-file", tags=["upload"])
-async def upload_file_from_client(file: UploadFile):
+async def upload_file_from_client(
+    file: UploadFile,
+    upload_id: Annotated[Union[str, None],
+        Query(description="The id of an interrupted upload to resume")
+    ]=None
+):
     """Upload the file given by user to Google Drive.
 
     Parameters
     ---------
     - file `UploadFile`: The fpile that needs to be uploaded by the user.
+    - upload_id `str | None`: The id of an interrupted upload of the
+        same file, to resume it.
 
     Returns:
-        dict[str, str]: The id of the file after uploading to drive.
+        dict[str, str]: The id of the file after uploading to drive,
+            and the id of the upload.
     """
     # * If you want to write the file locally, use below.
     # with open(f"data/{file.filename}", "wb") as buffer:
     #     buffer.write(await file.read())
-    return await upload_file_to_drive(file)
+    return await drive.upload_file_to_drive(file, upload_id)
+
+@app.get("/api/upload-file/{upload_id}", tags=["upload"])
+def read_upload_progress(upload_id: str):
+    """Get how much of a file has been uploaded to Google Drive.
+
+    Parameters
+    ---------
+    - upload_id `str`: The id of the upload.
+
+    Returns
+    -------
+    - dict: The size of the file, the bytes drive has received and the
+        status of the upload.
+    """
+    progress = drive.upload_progress(upload_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return progress
 
 @app.post("/api/form", tags=["upload"])
 async def login(
@@ -84,37 +236,65 @@ async def login(
     }
 
 @app.get("/api/folders", tags=["drive"])
-def read_all_folders():
+async def read_all_folders(request: Request, response: Response):
     """Get the names of all folders the application has access to.
 
     Returns
     --------
     - list: The drive folders it can read and upload files to
     """
-    return fetch_all_folders()
+    not_modified = await check_etag(request, response)
+    if not_modified is not None:
+        return not_modified
+    return await async_database.fetch_all_folders()
 
 @app.get("/api/read_sheet", tags=["drive"])
-def read_sheet():
+def read_sheet(
+    download: Annotated[bool,
+        Query(description="Download the sheet from drive first")
+    ]=False
+):
     """Read data from the excel sheet and update category and code data.
 
+    Nothing is read or written if the sheet is unchanged since it was
+    last read.
+
+    Parameters
+    ----------
+    - download `bool`: Whether to download the sheet from drive first,
+        if it was modified there.
+
     Returns
     -------
     - dict: The code list with its name, category and list of
         classifications
     """
-    excel = ExcelWorker()
-    return excel.code_list
+    if download and not drive.download_classification_sheet():
+        raise HTTPException(status_code=502,
+                            detail="The sheet could not be downloaded")
+    return excel.ExcelWorker().code_list
 
 @app.get("/api/files", tags=["data"],
     response_description="The list of files"
 )
-def read_all_files(
+async def read_all_files(
+    request: Request,
+    response: Response,
     code: Annotated[Union[str, None],
         Query(description="The code that needs to be searched for")
     ]=None,
     year: Annotated[str,
         Query(min_length=4, max_length=9,example="2021-2023")
-    ]=""
+    ]="",
+    limit: Annotated[Union[int, None],
+        Query(gt=0, le=10000, description="The most files to return")
+    ]=None,
+    after: Annotated[Union[str, None],
+        Query(description="The cursor returned with the previous page")
+    ]=None,
+    stream: Annotated[bool,
+        Query(description="Stream the files as newline delimited JSON")
+    ]=False
 ):
     """Get the data of all files that have been categorized
 
@@ -122,15 +302,159 @@ def read_all_files(
     ----------
     - cod `str | None`: The code that needs to be searched for
     - year `str`: The years of which data needs to be searched for.
+    - limit `int | None`: The most files to return, with the cursor of
+        the next page.
+    - after `str | None`: The cursor of the page to return.
+    - stream `bool`: Whether to send the files one per line as they
+        are read. A stream has no pages, so it cannot have a limit.
 
     Returns
     -------
-    - dict: The details of files that have been asked for.
+    - dict: The details of files that have been asked for, and the
+        cursor of the next page if a limit was given.
     """
-    if code not in CODE_LIST:
+    if code is not None and code not in code_index():
         raise HTTPException(status_code=404, detail="Code not found")
-    start_year, end_year = select_years(year)
-    return fetch_all_files(code, start_year, end_year)
+    if stream and limit is not None:
+        raise HTTPException(status_code=400,
+                            detail="A stream cannot have a limit")
+    if after is not None:
+        try:
+            database.decode_files_cursor(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    not_modified = await check_etag(request, response)
+    if not_modified is not None:
+        return not_modified
+    start_year, end_year = await select_years(year)
+
+    if stream:
+        async def file_lines():
+            async for file in async_database.stream_files(
+                    code, start_year, end_year, after):
+                yield dumps(file) + "\n"
+        return StreamingResponse(file_lines(), media_type="application/x-ndjson",
+                                 headers={"ETag": response.headers["ETag"]})
+
+    files, cursor = await cache.result_cache.get(
+        ("fetch_all_files", code, start_year, end_year, limit, after),
+        lambda: async_database.fetch_all_files(code, start_year, end_year,
+                                               limit, after),
+        size=cache.count_files
+    )
+    if limit is None:
+        return files
+    return {"files": files, "next": cursor}
+
+@app.get("/api/classification/{classification}/files", tags=["data"],
+    response_description="The files of the classification by year"
+)
+async def read_classification_files(
+    request: Request,
+    response: Response,
+    classification: str,
+    year: Annotated[str,
+        Query(min_length=4, max_length=9,example="2021-2023")
+    ]="",
+    limit: Annotated[Union[int, None],
+        Query(gt=0, le=10000, description="The most files to return")
+    ]=None,
+    after: Annotated[Union[str, None],
+        Query(description="The cursor returned with the previous page")
+    ]=None
+):
+    """Get the files of every code that counts towards a classification.
+
+    The codes of the classification are looked up in the code index,
+    and their files are read with a single query.
+
+    Parameters
+    ----------
+    - classification `str`: The criterion, like `"2.4.3"`.
+    - year `str`: The years of which data needs to be searched for.
+    - limit `int | None`: The most files to return.
+    - after `str | None`: The cursor of the page to return.
+
+    Returns
+    -------
+    - dict: The codes of the classification, its files by year, and the
+        cursor of the next page if a limit was given.
+    """
+    codes = code_index().codes_by_classification.get(classification)
+    if codes is None:
+        raise HTTPException(status_code=404, detail="Classification not found")
+    if after is not None:
+        try:
+            database.decode_files_cursor(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    not_modified = await check_etag(request, response)
+    if not_modified is not None:
+        return not_modified
+    start_year, end_year = await select_years(year)
+
+    files, cursor = await cache.result_cache.get(
+        ("fetch_all_files", codes, start_year, end_year, limit, after),
+        lambda: async_database.fetch_all_files(list(codes), start_year,
+                                               end_year, limit, after),
+        size=cache.count_files
+    )
+    result = {"classification": classification, "codes": codes, "files": files}
+    if limit is not None:
+        result["next"] = cursor
+    return result
+
+@app.get("/api/search", tags=["data"],
+    response_description="The files that match, best first"
+)
+async def search_files(
+    request: Request,
+    response: Response,
+    q: Annotated[str,
+        Query(min_length=1, max_length=100,
+              description="Fragments of the name of the file")
+    ],
+    year: Annotated[str,
+        Query(max_length=9, example="2021-2023")
+    ]="",
+    code: Annotated[Union[str, None],
+        Query(description="Only the files of this code")
+    ]=None,
+    limit: Annotated[int,
+        Query(gt=0, le=100, description="The most files to return")
+    ]=20
+):
+    """Find classified and exempted files by fragments of their name.
+
+    Every word of the query has to be in the name, either anywhere in
+    it, or at the start of a word for words shorter than three letters.
+
+    Parameters
+    ----------
+    - q `str`: The fragments of the name, like a title, date or author.
+    - year `str`: Only the classified files of these years, if given.
+    - code `str | None`: Only the classified files of this code.
+    - limit `int`: The most files to return.
+
+    Returns
+    -------
+    - dict: The query and the files that match, best first.
+    """
+    if code is not None and code not in code_index():
+        raise HTTPException(status_code=404, detail="Code not found")
+    # The index may still be from an older generation while it is
+    # brought up to date, so the response is tagged with that one.
+    index = await search.search_index.ready()
+    not_modified = await check_etag(request, response, index.generation)
+    if not_modified is not None:
+        return not_modified
+    start_year = end_year = None
+    if year != "":
+        start_year, end_year = await select_years(year)
+    return {
+        "query": q,
+        "results": index.search(q, start_year, end_year, code, limit)
+    }
 
 @app.get("/", tags=["utility"])
 def read_root():
@@ -143,27 +467,168 @@ def read_root():
     return {"Ping": "Pong"}
 
 @app.get("/api/refresh", tags=["utility"])
-def refresh_drive_data():
-    """Rescan all documents in the drive and update data.
+def refresh_drive_data(
+    full: Annotated[bool,
+        Query(description="Rescan every folder instead of only the changes")
+    ]=False,
+    parallel: Annotated[bool,
+        Query(description="List the folders of a full rescan concurrently")
+    ]=True
+):
+    """Start updating the data with the documents changed in the drive.
 
-    Update the data in the database if there is any change to the file
-    names in drive.
+    Only the files added, renamed, trashed or moved since the last
+    refresh are read, unless a full rescan is asked for or there is no
+    record of a previous refresh. The refresh runs in the background;
+    if one is already running, its job is returned instead.
+
+    Parameters
+    ----------
+    - full `bool`: Whether to rescan all documents in the drive.
+    - parallel `bool`: Whether to list the folders at the same time
+        during a full rescan.
 
     Returns
     -------
-    - JSON[str, int]: The count of files the program has scanned
+    - JSON: The id of the refresh job, and whether it was already
+        running.
+    """
+    return jobs.start_refresh_job(full, parallel)
+
+@app.get("/api/refresh/{job_id}", tags=["utility"])
+def read_refresh_job(job_id: str):
+    """Get the progress of a refresh job.
+
+    Returns
+    -------
+    - JSON: The status of the job, the folders done, files processed,
+        rate and errors so far, and the count of files scanned once
+        it is done.
+    """
+    job = jobs.refresh_job_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/refresh/{job_id}/events", tags=["utility"])
+async def stream_refresh_job(job_id: str):
+    """Stream the progress of a refresh job as server-sent events.
+
+    An event is sent whenever the job changes, until it is done or has
+    failed. A job whose worker stopped is marked as failed.
     """
-    return scan_drive()
+    if await async_database.fetch_job_document(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def job_events():
+        last_event = None
+        while True:
+            job = await async_database.fetch_job_document(job_id)
+            if job is not None and jobs.job_stopped(
+                    job, await async_database.fetch_lock(jobs.REFRESH_LOCK)):
+                await async_database.fail_job_document(job_id, jobs.STOPPED_ERROR)
+                job = await async_database.fetch_job_document(job_id)
+            if job is None:
+                break
+            job["job_id"] = job.pop("_id")
+            event = dumps(job, default=str)
+            if event != last_event:
+                yield f"data: {event}\n\n"
+                last_event = event
+            if job["status"] in ("done", "failed"):
+                break
+            await asyncio.sleep(1)
+
+    return StreamingResponse(job_events(), media_type="text/event-stream")
 
 @app.get("/api/sort", tags=["utility"])
-def sort_years():
+async def sort_years(request: Request, response: Response):
     """Fetch the years of which data is available.
 
     Returns
     -------
     - int, int: The starting and ending years of data available.
     """
-    return get_valid_years()
+    not_modified = await check_etag(request, response)
+    if not_modified is not None:
+        return not_modified
+    return await async_database.get_valid_years()
+
+@app.get("/api/cache", tags=["utility"])
+def read_cache_stats():
+    """Get how well the query results of this worker are cached.
+
+    Returns
+    -------
+    - dict: The size of the cache, its hits, misses, requests that
+        waited for a result being computed, and evictions, and the size
+        of the search index.
+    """
+    return {**cache.result_cache.stats(), "search": search.search_index.stats()}
+
+@app.get("/api/indexes", tags=["utility"])
+def check_indexes():
+    """Explain the queries of the api and flag the collection scans.
+
+    Returns
+    -------
+    - list[dict]: The plan stages of each query, and whether it scans
+        the whole collection.
+    """
+    return indexes.explain_queries()
+
+@app.get("/metrics", tags=["utility"], response_class=PlainTextResponse)
+def read_metrics():
+    """Get the metrics of this worker in the Prometheus text format.
+
+    Returns
+    -------
+    - str: The latency of each route, database command and drive call,
+        and the files and pages read by scans.
+    """
+    return PlainTextResponse(render_metrics(),
+                             media_type="text/plain; version=0.0.4")
+
+@app.get("/api/startup", tags=["utility"])
+def read_startup_steps():
+    """Get how long this worker took to warm up and to import the
+    modules loaded on first use.
+
+    Returns
+    -------
+    - dict: The seconds taken by each step and the number of modules
+        it loaded, in the order they ran.
+    """
+    return startup_steps
+
+@app.get("/api/profiles", tags=["utility"])
+def read_profiles(request: Request):
+    """List the profiled requests kept on disk, for admins.
+
+    Returns
+    -------
+    - list[dict]: The id, path, query, status and duration of each
+        profiled request, newest first.
+    """
+    check_admin(request)
+    return list_profiles()
+
+@app.get("/api/profiles/{profile_id}/{kind}", tags=["utility"])
+def read_profile(request: Request, profile_id: str, kind: str):
+    """Download a profile, for admins.
+
+    Parameters
+    ----------
+    - profile_id `str`: The id of the profile.
+    - kind `str`: `pstats` for the cProfile stats, or `collapsed` for the
+        sampled stacks to draw a flamegraph of.
+    """
+    check_admin(request)
+    path = profile_path(profile_id, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type=PROFILE_FILES[kind],
+                        filename=f"{profile_id}.{kind}")
 
 @app.post("/api/read-file", tags=["utility"])
 async def read_file(file: UploadFile):
@@ -178,7 +643,48 @@ async def read_file(file: UploadFile):
     """
     return {"filename": file.filename}
 
-def select_years(year: str=""):
+async def check_etag(request: Request, response: Response,
+        generation: Union[int, None] = None):
+    """Tag the response with the generation of the data and the query.
+
+    The data only changes when the generation goes up, so a client
+    that already has the response for the same query and generation is
+    answered with 304 without reading the data.
+
+    Parameters
+    ----------
+    - generation `int | None`: The generation the response is made
+        from, if not the current one.
+
+    Returns
+    -------
+    - Response | None: The 304 response if the client's copy is still
+        current, None if the response needs to be made.
+    """
+    if generation is None:
+        generation = await cache.result_cache.current_generation()
+    query = "&".join(sorted(
+        f"{key}={value}" for key, value in request.query_params.multi_items()
+    ))
+    digest = sha1(f"{request.url.path}?{query}".encode()).hexdigest()[:16]
+    etag = f'W/"{generation}-{digest}"'
+    response.headers["ETag"] = etag
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] \
+            or if_none_match.strip() == "*":
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+def check_admin(request: Request):
+    """Stop a request that does not carry the profile token."""
+    if PROFILE_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Profiling is off")
+    token = request.headers.get("x-profile-token") \
+        or request.query_params.get("profile_token")
+    if not is_admin(token):
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+async def select_years(year: str=""):
     """Select the valid years from the query given to api.
 
     Parameters
@@ -189,10 +695,12 @@ def select_years(year: str=""):
     - int: The start year
     - int: The end year
     """
-    min_year, max_year = get_valid_years()
     years = [int(x) for x in re.findall("\d{4}", year)]
     if len(years) == 0:
-        start_year, end_year = min_year, max_year
+        start_year, end_year = await async_database.get_valid_years()
+        if start_year is None:
+            # There are no files yet.
+            start_year = end_year = date.today().year
     elif len(years) == 1:
         start_year, end_year = years[0], years[0]
     else:
@@ -205,5 +713,4 @@ def select_years(year: str=""):
 
 if __name__ == "__main__":
     uvicorn.run("main:app", reload=True)
-    # uvicorn.run("main:app", host="0.0.0.0", port=80)
-# print(perf_counter() - time_now)
\ No newline at end of file
+    # uvicorn.run("main:app", host="0.0.0.0", port=80)
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""Maintenance commands for the backend.
+
+Run from this folder, eg. `python manage.py rollup`.
+"""
+import argparse
+from json import dumps
+
+
+def rollup(args: argparse.Namespace):
+    """Check or rebuild the `naac_counts` rollup."""
+    from drivereader.database import check_naac_counts, rebuild_naac_counts
+
+    if args.rebuild:
+        print(f"Rebuilt naac_counts with {rebuild_naac_counts()} rows.")
+        return 0
+    mismatches = check_naac_counts()
+    for mismatch in mismatches:
+        print(dumps(mismatch))
+    print(f"{len(mismatches)} rows of naac_counts differ from files_data.")
+    return 1 if len(mismatches) != 0 else 0
+
+def indexes(args: argparse.Namespace):
+    """Create the indexes, and explain the queries that use them."""
+    from drivereader.indexes import ensure_indexes, explain_queries
+
+    for collection, names in ensure_indexes().items():
+        print(f"{collection}: {', '.join(names)}")
+    if not args.explain:
+        return 0
+    scans = 0
+    for query in explain_queries():
+        flag = "ok"
+        if query["collection_scan"]:
+            flag = "COLLSCAN, reads all" if query["reads_all"] else "COLLSCAN"
+        print(f"[{flag}] {query['function']} on {query['collection']}: "
+              f"{' > '.join(query['stages'])}")
+        # Only a scan where the query was not meant to read everything.
+        scans += query["collection_scan"] and not query["reads_all"]
+    return 1 if scans != 0 else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rollup_parser = commands.add_parser(
+        "rollup",
+        help="Check naac_counts against files_data, or rebuild it."
+    )
+    rollup_parser.add_argument(
+        "--rebuild", action="store_true",
+        help="Recompute naac_counts from files_data."
+    )
+    rollup_parser.set_defaults(handler=rollup)
+
+    indexes_parser = commands.add_parser(
+        "indexes",
+        help="Create the indexes of the collections."
+    )
+    indexes_parser.add_argument(
+        "--explain", action="store_true",
+        help="Explain the queries of the api and flag collection scans."
+    )
+    indexes_parser.set_defaults(handler=indexes)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
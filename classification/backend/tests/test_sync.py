@@ -0,0 +1,164 @@
+"""Check the incremental sync of `drivereader.drive` against the fake
+drive of `benchmarks.fake_drive`, with an in-memory database.
+
+The fake drive is filled and scanned, then files are added, renamed
+between classified and exempted, trashed, moved out of the tracked
+folders and deleted, and files outside of them are changed. After each
+sync the stored files are compared with what drive holds. Last, the
+page token is expired with each status drive rejects a token with, and
+the sync has to fall back to a full rescan that also removes the files
+gone from drive.
+
+Run from the backend folder:
+
+    python -m pytest tests
+"""
+import os
+import tempfile
+import threading
+from json import dump
+
+import pytest
+
+pytest.importorskip("mongomock")
+pytest.importorskip("mongomock_motor")
+
+from benchmarks.corpus import use_memory_database
+from benchmarks.fake_drive import FakeDrive, populate
+from drivereader import database, drive
+from drivereader.client import drive_client
+from drivereader.codes import code_index
+
+
+def stored_ids(collection) -> set[str]:
+    return {document["_id"] for document in collection.find({}, {"_id": 1})}
+
+def write_folders(folder_names: list[str]):
+    with open(drive.FOLDERS_FILE, "w") as file:
+        dump(folder_names, file)
+
+
+class Synced():
+    """The fake drive, scanned once, and what the checks need of it."""
+
+    def __init__(self, fake: FakeDrive, folder_names: list[str],
+            outside: dict, outside_file: dict) -> None:
+        self.fake = fake
+        self.folder_names = folder_names
+        self.outside = outside
+        self.outside_file = outside_file
+        self.codes = code_index().codes
+        self.code = sorted(self.codes)[0]
+        self.folder_ids = {folder["_id"] for folder in database.fetch_all_folders()}
+        self.folder_id = sorted(self.folder_ids)[0]
+        tracked = sorted(
+            (file for file in fake.files.values()
+             if self.folder_ids.intersection(file["parents"])),
+            key=lambda file: file["name"]
+        )
+        self.classified = [
+            file for file in tracked
+            if drive.file_details_from_name(file["name"], self.codes)[1]
+        ]
+        self.exempted = [file for file in tracked if file not in self.classified]
+
+    def check_stored(self):
+        """The stored files are those of drive in the tracked folders."""
+        expected = {"file": set(), "exempt": set()}
+        for file in self.fake.files.values():
+            if file["mimeType"] == drive.FOLDER_MIME_TYPE or file["trashed"] \
+                    or not self.folder_ids.intersection(file["parents"]):
+                continue
+            year, code = drive.file_details_from_name(file["name"], self.codes)
+            expected["file" if code is not None else "exempt"].add(file["id"])
+        assert stored_ids(database.files_data) == expected["file"]
+        assert stored_ids(database.exempt_data) == expected["exempt"]
+        assert database.check_naac_counts() == []
+
+
+@pytest.fixture
+def synced():
+    use_memory_database()
+    for collection in (database.files_data, database.exempt_data,
+                       database.folders_data, database.naac_counts):
+        collection.drop()
+    database.meta_data.delete_many({"_id": {"$in": ["folders_config",
+                                                    "drive_changes"]}})
+
+    fake = FakeDrive()
+    folder_names = populate(fake, 2, 20, sorted(code_index().codes),
+                            exempt_share=0.2)
+    outside = fake.add_folder("Untracked Folder")
+    outside_file = fake.add_file("20200101_Untracked.pdf", [outside["id"]])
+    server = fake.serve()
+    root_url, folders_file = drive_client.root_url, drive.FOLDERS_FILE
+    drive_client.root_url = server.root_url
+    # The services of the threads still point at the last fake drive.
+    drive_client.local = threading.local()
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as file:
+        drive.FOLDERS_FILE = file.name
+    write_folders(folder_names)
+    try:
+        summary = drive.scan_drive(parallel=False)
+        assert summary["total_count"] == 40
+        yield Synced(fake, folder_names, outside, outside_file)
+    finally:
+        server.shutdown()
+        server.server_close()
+        drive_client.root_url, drive.FOLDERS_FILE = root_url, folders_file
+        drive_client.local = threading.local()
+        os.remove(file.name)
+
+def test_full_scan(synced: Synced):
+    synced.check_stored()
+
+def test_sync_applies_changes(synced: Synced):
+    fake, code = synced.fake, synced.code
+    added = fake.add_file(f"20230101_{code}_Added.pdf", [synced.folder_id])
+    fake.rename_file(synced.classified[0]["id"], "Now exempted.pdf")
+    fake.rename_file(synced.exempted[0]["id"], f"20230202_{code}_Now classified.pdf")
+    fake.trash_file(synced.classified[1]["id"])
+    fake.move_file(synced.classified[2]["id"], [synced.outside["id"]])
+    fake.delete_file(synced.classified[3]["id"])
+    summary = drive.sync_drive_changes()
+    assert summary["mode"] == "incremental"
+    assert database.files_data.find_one({"_id": added["id"]}) is not None
+    # Trashed, moved out and deleted.
+    assert summary["removed_count"] == 3
+    synced.check_stored()
+
+def test_changes_outside_the_folders_are_not_written(synced: Synced):
+    fake = synced.fake
+    generation = database.fetch_generation()
+    fake.rename_file(synced.outside_file["id"], "20200101_Still untracked.pdf")
+    fake.add_file(f"20230303_{synced.code}_Elsewhere.pdf", [synced.outside["id"]])
+    summary = drive.sync_drive_changes()
+    assert summary["write_count"] == 0
+    assert summary["removed_count"] == 0
+    assert database.fetch_generation() == generation
+
+@pytest.mark.parametrize("status", [400, 404, 410])
+def test_rejected_token_falls_back_to_a_full_rescan(synced: Synced, status: int):
+    fake = synced.fake
+    fake.expire_changes(status)
+    added = fake.add_file(f"20230404_{synced.code}_After {status}.pdf",
+                          [synced.folder_id])
+    fake.trash_file(synced.classified[0]["id"])
+    fake.move_file(synced.exempted[0]["id"], [synced.outside["id"]])
+    fake.delete_file(synced.classified[1]["id"])
+    summary = drive.sync_drive_changes()
+    assert summary["mode"] == "full"
+    assert database.files_data.find_one({"_id": added["id"]}) is not None
+    assert summary["removed_count"] == 3
+    synced.check_stored()
+
+def test_rescan_with_a_missing_folder_removes_nothing(synced: Synced):
+    fake = synced.fake
+    write_folders(synced.folder_names + ["Missing Folder"])
+    fake.expire_changes()
+    trashed = synced.classified[0]["id"]
+    fake.trash_file(trashed)
+    summary = drive.sync_drive_changes()
+    assert summary["mode"] == "full"
+    assert summary["removed_count"] == 0
+    assert database.files_data.find_one({"_id": trashed}) is not None